@@ -0,0 +1,92 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../servers"))
+from http_pool import HttpPool
+
+# Compare a new aiohttp.ClientSession per tool call (before) with the shared
+# HttpPool session (after). Without --url a local upstream is started.
+#
+#   python bench_http_pool.py --calls 500 --concurrency 10
+#   python bench_http_pool.py --url https://go-global-apex.architecture.caradhras.io/account/info --jwt $JWT
+
+session_timeout = aiohttp.ClientTimeout(total=600)
+
+async def start_local_upstream():
+    async def info(request):
+        return web.json_response({"status": "ok", "service": "bench"})
+
+    app = web.Application()
+    app.router.add_get("/info", info)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/info"
+
+async def call_per_session(url, headers):
+    async with aiohttp.ClientSession(timeout=session_timeout) as session:
+        async with session.get(url, headers=headers) as resp:
+            return resp.status, await resp.json()
+
+async def call_pooled(url, headers):
+    session = HttpPool.get_session(url)
+    async with session.get(url, headers=headers) as resp:
+        return resp.status, await resp.json()
+
+async def run(call, url, headers, calls, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await call(url, headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(calls)))
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+    }
+
+async def main(args):
+    runner = None
+    url = args.url
+    if url is None:
+        runner, url = await start_local_upstream()
+
+    headers = {"Authorization": f"Bearer {args.jwt}"}
+    HttpPool.initialize(session_timeout)
+
+    try:
+        before = await run(call_per_session, url, headers, args.calls, args.concurrency)
+        after = await run(call_pooled, url, headers, args.calls, args.concurrency)
+    finally:
+        await HttpPool.close()
+        if runner:
+            await runner.cleanup()
+
+    print("-" * 45)
+    print(f"url: {url} calls: {args.calls} concurrency: {args.concurrency}")
+    print("-" * 45)
+    print(f"{'mode':<12}{'p50 (ms)':>12}{'p99 (ms)':>12}")
+    print(f"{'per-call':<12}{before['p50']:>12.2f}{before['p99']:>12.2f}")
+    print(f"{'pooled':<12}{after['p50']:>12.2f}{after['p99']:>12.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--jwt", default="bench")
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
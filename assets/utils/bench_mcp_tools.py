@@ -0,0 +1,300 @@
+import os
+import sys
+import json
+import time
+import re
+import random
+import base64
+import asyncio
+import argparse
+import platform
+import subprocess
+
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+# Drive tools/call over streamable-http against an mcp server and report throughput,
+# p50/p95/p99 latency, error rates and the server RSS as JSON (stdout or --out), so
+# runs can be compared across changes. The human readable table goes to stderr.
+#
+#   python bench_mcp_tools.py --preset math --sessions 4 --concurrency 32 --duration 30
+#   python bench_mcp_tools.py --preset code --url http://127.0.0.1:9002/mcp --pid $(pgrep -f code_server.py)
+#   python bench_mcp_tools.py --url http://127.0.0.1:9002/mcp --mix mix.json --out results.json
+#
+#   mix.json: [{"tool": "get_account", "args": {"account": "ACC-1000"}, "weight": 5},
+#              {"tool": "summarize_account_statement", "args": {"account": "ACC-1001"}, "weight": 1}]
+#
+# The code preset expects code_server to run against assets/utils/fake_upstream.py.
+
+PRESETS = {
+    "math": {
+        "url": "http://127.0.0.1:9001/mcp",
+        "mix": [
+            {"tool": "add", "args": {"a": 2, "b": 3}, "weight": 1},
+            {"tool": "multiple", "args": {"a": 4, "b": 5}, "weight": 1},
+            {"tool": "divide", "args": {"a": 10, "b": 2}, "weight": 1},
+        ],
+    },
+    "general": {
+        "url": "http://127.0.0.1:9000/mcp",
+        "mix": [
+            {"tool": "get_current_time", "args": {}, "weight": 3},
+            {"tool": "get_weather", "args": {"location": "Sao Paulo"}, "weight": 1},
+        ],
+    },
+    "code": {
+        "url": "http://127.0.0.1:9002/mcp",
+        "mix": [
+            {"tool": "get_account", "args": {"account": "ACC-1000"}, "weight": 5},
+            {"tool": "get_accounts", "args": {"accounts": ["ACC-1000", "ACC-1001", "ACC-1002"]}, "weight": 2},
+            {"tool": "get_person_portfolio", "args": {"person": "P-0000"}, "weight": 1},
+            {"tool": "summarize_account_statement", "args": {"account": "ACC-1001"}, "weight": 1},
+            {"tool": "all_services_healthy", "args": {}, "weight": 1},
+        ],
+    },
+}
+
+def bench_jwt() -> str:
+    """Unsigned token that passes the local pre-validation of code_server, the fake upstream ignores it"""
+    def b64(data: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+    return f"{b64({'alg': 'none'})}.{b64({'sub': 'bench', 'exp': int(time.time()) + 86400})}.bench"
+
+def process_rss(pid: int):
+    """Resident set size in MB of pid, None when it can not be read (not linux, process gone)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+def child_pids(pid: int) -> list:
+    """Direct children of pid, from the ppid field of /proc/<pid>/stat"""
+    children = []
+    for entry in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # the command name is in parentheses and may contain spaces
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+def read_rss(pid: int):
+    """RSS in MB of pid and all its descendants (the workers of a WORKERS>1 server), None when pid can not be read"""
+    rss = process_rss(pid)
+    if rss is None:
+        return None
+    pending = child_pids(pid)
+    while pending:
+        child = pending.pop()
+        rss += process_rss(child) or 0
+        pending.extend(child_pids(child))
+    return rss
+
+def percentile(ordered: list, p: float):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+def summarize(latencies: list, errors: int, tool_errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    calls = len(latencies)
+    return {
+        "calls": calls,
+        "throughput_rps": round(calls / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2) if ordered else None,
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 2) if ordered else None,
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2) if ordered else None,
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else None,
+        "errors": errors,
+        "tool_errors": tool_errors,
+        "error_rate": round((errors + tool_errors) / calls, 4) if calls else None,
+    }
+
+class Recorder:
+    """Latencies and error counts per tool, only after the warmup"""
+
+    def __init__(self):
+        self.recording = False
+        self.latencies = {}
+        self.errors = {}
+        self.tool_errors = {}
+
+    def record(self, tool: str, seconds: float, error: bool, tool_error: bool):
+        if not self.recording:
+            return
+        self.latencies.setdefault(tool, []).append(seconds)
+        self.errors[tool] = self.errors.get(tool, 0) + error
+        self.tool_errors[tool] = self.tool_errors.get(tool, 0) + tool_error
+
+    def report(self, elapsed: float) -> dict:
+        tools = {tool: summarize(self.latencies[tool], self.errors[tool], self.tool_errors[tool], elapsed)
+                 for tool in self.latencies}
+        total = summarize([value for values in self.latencies.values() for value in values],
+                          sum(self.errors.values()), sum(self.tool_errors.values()), elapsed)
+        return {"total": total, "tools": tools}
+
+# the error messages of the code_server tools, plain or as the last key of a JSON error body,
+# a result with per item errors (e.g. a batch) is not an error
+TOOL_ERROR = re.compile(r"(Failed to .*|.*, NOT AUTHORIZED), statuscode: \d+", re.S)
+TOOL_ERROR_JSON = re.compile(r'\{.*"message":"Failed to [^"]*, statuscode: \d+"\}', re.S)
+
+def is_tool_error(result) -> bool:
+    """isError results and the error messages code_server returns as text"""
+    if result.isError:
+        return True
+    text = " ".join(getattr(content, "text", "") for content in result.content)
+    return bool(TOOL_ERROR.fullmatch(text) or TOOL_ERROR_JSON.fullmatch(text))
+
+async def worker(session, mix, weights, context, recorder, stop_at, rng):
+    while time.monotonic() < stop_at:
+        call = rng.choices(mix, weights)[0]
+        args = dict(call.get("args", {}))
+        if context is not None:
+            args["context"] = context
+        start = time.perf_counter()
+        error = tool_error = False
+        try:
+            result = await session.call_tool(call["tool"], args)
+            tool_error = is_tool_error(result)
+        except Exception:
+            error = True
+        recorder.record(call["tool"], time.perf_counter() - start, error, tool_error)
+
+async def open_session(url: str, ready: asyncio.Event, stop: asyncio.Event, sessions: list):
+    async with streamablehttp_client(url) as (read, write, _):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            sessions.append(session)
+            ready.set()
+            await stop.wait()
+
+async def sample_rss(pid: int, samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        rss = read_rss(pid)
+        if rss is not None:
+            samples.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.5)
+        except asyncio.TimeoutError:
+            pass
+
+async def main(args):
+    preset = PRESETS.get(args.preset, {})
+    url = args.url or preset.get("url")
+    if args.mix:
+        with open(args.mix) as f:
+            mix = json.load(f)
+    else:
+        mix = preset.get("mix")
+    if not url or not mix:
+        sys.exit("set --url and --mix, or a --preset")
+    weights = [call.get("weight", 1) for call in mix]
+    context = {"jwt": args.jwt or bench_jwt()} if args.preset == "code" or args.jwt else None
+
+    stop = asyncio.Event()
+    sessions = []
+    start = time.perf_counter()
+    holders = []
+    for _ in range(args.sessions):
+        ready = asyncio.Event()
+        holder = asyncio.create_task(open_session(url, ready, stop, sessions))
+        holders.append(holder)
+        ready_wait = asyncio.create_task(ready.wait())
+        await asyncio.wait([ready_wait, holder], return_when=asyncio.FIRST_COMPLETED)
+        if not ready.is_set():
+            # the session could not be opened (server down, wrong url)
+            ready_wait.cancel()
+            stop.set()
+            await asyncio.gather(*holders, return_exceptions=True)
+            holder.result()
+    session_setup_ms = (time.perf_counter() - start) * 1000 / args.sessions
+
+    rss_samples = []
+    rss_before = read_rss(args.pid) if args.pid else None
+    sampler = asyncio.create_task(sample_rss(args.pid, rss_samples, stop)) if args.pid else None
+
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    stop_at = time.monotonic() + args.warmup + args.duration
+    workers = [asyncio.create_task(worker(sessions[i % len(sessions)], mix, weights, context, recorder, stop_at,
+                                          random.Random(rng.random())))
+               for i in range(args.concurrency)]
+    await asyncio.sleep(args.warmup)
+    recorder.recording = True
+    measured_from = time.perf_counter()
+    await asyncio.gather(*workers)
+    elapsed = time.perf_counter() - measured_from
+
+    stop.set()
+    if sampler:
+        await sampler
+    await asyncio.gather(*holders, return_exceptions=True)
+
+    report = {
+        "url": url,
+        "preset": args.preset,
+        "git_commit": git_commit(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "settings": {"sessions": args.sessions, "concurrency": args.concurrency,
+                     "duration": args.duration, "warmup": args.warmup, "seed": args.seed, "mix": mix},
+        "session_setup_ms": round(session_setup_ms, 2),
+        "elapsed_seconds": round(elapsed, 3),
+        **recorder.report(elapsed),
+        "server_rss_mb": {
+            "before": rss_before,
+            "peak": max(rss_samples) if rss_samples else None,
+            "after": read_rss(args.pid) if args.pid else None,
+        },
+    }
+    print_table(report)
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def print_table(report: dict):
+    rows = [("TOTAL", report["total"])] + sorted(report["tools"].items())
+    print("-" * 96, file=sys.stderr)
+    print(f"{report['url']} sessions: {report['settings']['sessions']} concurrency: {report['settings']['concurrency']}"
+          f" rss peak: {report['server_rss_mb']['peak']} MB", file=sys.stderr)
+    print("-" * 96, file=sys.stderr)
+    print(f"{'tool':<30}{'calls':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}{'tool err':>9}",
+          file=sys.stderr)
+    for name, stats in rows:
+        print(f"{name:<30}{stats['calls']:>8}{stats['throughput_rps'] or 0:>10.1f}{stats['p50_ms'] or 0:>10.2f}"
+              f"{stats['p95_ms'] or 0:>10.2f}{stats['p99_ms'] or 0:>10.2f}{stats['errors']:>9}{stats['tool_errors']:>9}",
+              file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--preset", choices=sorted(PRESETS), default=None)
+    parser.add_argument("--url", default=None, help="mcp endpoint, e.g. http://127.0.0.1:9002/mcp")
+    parser.add_argument("--mix", default=None, help="json file: [{tool, args, weight}, ...]")
+    parser.add_argument("--jwt", default=None, help="jwt sent in the tool context, code preset generates one")
+    parser.add_argument("--sessions", type=int, default=4, help="mcp sessions shared by the workers")
+    parser.add_argument("--concurrency", type=int, default=16, help="calls in flight")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds run before measuring")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pid", type=int, default=None, help="server pid to sample its RSS, its worker processes included")
+    parser.add_argument("--out", default=None, help="write the json report to this file instead of stdout")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,92 @@
+import os
+import sys
+import glob
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../servers"))
+from result_encoder import encode_result
+
+# Compare the old f"{data}" tool result with the compact JSON encoder, with and
+# without a fields projection. Recorded payloads can be given as a directory
+# of *.json files (one upstream response per file), otherwise payloads shaped
+# like the ledger, account and card responses are generated.
+#
+#   python bench_result_encoding.py
+#   python bench_result_encoding.py --payloads ./recorded --fields account_id amount type
+
+try:
+    import tiktoken
+    encoding = tiktoken.get_encoding("cl100k_base")
+    def count_tokens(text):
+        return len(encoding.encode(text))
+except ImportError:
+    encoding = None
+    def count_tokens(text):
+        # ~4 characters per token when tiktoken is not installed
+        return len(text) // 4
+
+def generated_payloads() -> dict:
+    random.seed(42)
+    moviments = [{
+        "id": i,
+        "account_id": "ACC-501",
+        "type": random.choice(["DEPOSIT", "WITHDRAW"]),
+        "currency": "BRL",
+        "amount": round(random.uniform(1, 5000), 2),
+        "transaction_at": f"2026-09-{1 + i % 28:02d}T10:{i % 60:02d}:00Z",
+        "request_id": f"{random.getrandbits(64):016x}",
+        "tenant_id": "TENANT-001",
+    } for i in range(500)]
+    return {
+        "ledger_statement": {
+            "account_balance": {"account_id": "ACC-501", "currency": "BRL", "amount": 12345.67},
+            "moviment_statement": moviments,
+        },
+        "account": {"id": 1, "account_id": "ACC-501", "person_id": "P-501",
+                    "created_at": "2026-01-01T00:00:00Z", "updated_at": None, "tenant_id": "TENANT-001"},
+        "card_payments": [{
+            "id": i, "card_number": "111.111.000.501", "card_type": "CREDIT", "card_model": "CHIP",
+            "terminal": "TERM-1", "mcc": "FOOD", "currency": "BRL", "amount": round(random.uniform(1, 300), 2),
+            "status": "AUTHORIZED", "payment_at": f"2026-09-{1 + i % 28:02d}T12:00:00Z",
+        } for i in range(100)],
+    }
+
+def recorded_payloads(directory: str) -> dict:
+    payloads = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(path) as f:
+            payloads[os.path.splitext(os.path.basename(path))[0]] = json.load(f)
+    return payloads
+
+def measure(fn, data, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        text = fn(data)
+    return text, (time.perf_counter() - start) / rounds * 1e6
+
+def main(args):
+    payloads = recorded_payloads(args.payloads) if args.payloads else generated_payloads()
+    modes = {
+        "repr": lambda data: f"{data}",
+        "json": lambda data: encode_result(data),
+        "json+fields": lambda data: encode_result(data, args.fields),
+    }
+
+    print("-" * 78)
+    print(f"tokens counted with {'tiktoken cl100k_base' if encoding else 'len/4 estimate'}, fields: {args.fields}")
+    print("-" * 78)
+    print(f"{'payload':<20}{'mode':<14}{'bytes':>10}{'tokens':>10}{'encode (us)':>14}")
+    for name, data in payloads.items():
+        for mode, fn in modes.items():
+            text, micros = measure(fn, data, args.rounds)
+            print(f"{name:<20}{mode:<14}{len(text.encode()):>10}{count_tokens(text):>10}{micros:>14.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--payloads", default=None)
+    parser.add_argument("--fields", nargs="+", default=["account_id", "type", "amount", "transaction_at", "status"])
+    parser.add_argument("--rounds", type=int, default=200)
+    main(parser.parse_args())
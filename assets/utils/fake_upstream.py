@@ -0,0 +1,254 @@
+import json
+import random
+import asyncio
+import argparse
+
+from datetime import datetime, timedelta
+from aiohttp import web
+
+# Local stand-in of the payment platform (account, card, payment-gateway, gateway-grpc,
+# limit, ledger) and of the graph memory service, with seeded synthetic data, to
+# benchmark code_server offline. Every route answers after its configured latency,
+# fails with its error rate and can be padded to a payload size.
+#
+#   python fake_upstream.py --latency 0.02 --jitter 0.01 --error-rate 0.01
+#   python fake_upstream.py --routes routes.json
+#
+#   routes.json: {"ledger_statement": {"latency": 0.3, "payload_bytes": 65536},
+#                 "card_get": {"error_rate": 0.2, "error_status": 503}}
+#
+# then start code_server with the printed APEX_BASE_URL, GLOBAL_BASE_URL and GRAPH_BASE_URL.
+
+SERVICES = ("gateway-grpc", "payment-gateway", "account", "card", "limit", "ledger")
+MOVIMENT_TYPES = ("DEPOSIT", "WITHDRAW", "CREDIT", "DEBIT", "TRANSFER", "REFUND")
+
+class FakePlatform:
+    """Synthetic persons, accounts, cards, payments and moviments, the same for a given seed"""
+
+    def __init__(self, seed: int, persons: int, moviments: int):
+        rng = random.Random(seed)
+        start = datetime(2025, 1, 1)
+        self.accounts = {}
+        self.person_accounts = {}
+        self.cards = {}
+        self.payments = {}
+        self.statements = {}
+        self.graph = []
+        for p in range(persons):
+            person = f"P-{p:04d}"
+            self.person_accounts[person] = []
+            for a in range(rng.randint(1, 3)):
+                account = f"ACC-{1000 + len(self.accounts)}"
+                self.person_accounts[person].append(account)
+                self.accounts[account] = {
+                    "account_id": account,
+                    "person_id": person,
+                    "tenant_id": "TENANT-001",
+                    "status": "ACTIVE",
+                    "created_at": (start + timedelta(days=rng.randint(0, 300))).isoformat(),
+                }
+                card = f"{rng.randint(100, 999)}.{rng.randint(1000, 9999)}.{rng.randint(100, 999)}.{len(self.cards):03d}"
+                self.cards[card] = {
+                    "card_number": card,
+                    "account_id": account,
+                    "holder": person,
+                    "type": rng.choice(("CREDIT", "DEBIT")),
+                    "model": rng.choice(("PLASTIC", "VIRTUAL")),
+                    "status": "ACTIVE",
+                }
+                self.payments[card] = [{
+                    "payment_id": f"PAY-{card}-{i}",
+                    "card_number": card,
+                    "terminal": f"TERM-{rng.randint(1, 99):02d}",
+                    "mcc": rng.choice(("FOOD", "GAS", "TRAVEL", "COMPUTE")),
+                    "currency": "BRL",
+                    "amount": round(rng.uniform(1, 500), 2),
+                    "payment_at": (start + timedelta(days=rng.randint(0, 300), minutes=i)).isoformat(),
+                } for i in range(rng.randint(5, 20))]
+                self.statements[account] = [{
+                    "id": i,
+                    "type": rng.choice(MOVIMENT_TYPES),
+                    "currency": "BRL",
+                    "amount": round(rng.uniform(1, 2000), 2),
+                    "transaction_at": (start + timedelta(days=rng.randint(0, 300), minutes=i)).isoformat(),
+                } for i in range(moviments)]
+
+def route_settings(args, overrides: dict, name: str) -> dict:
+    return {
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "error_rate": args.error_rate,
+        "error_status": args.error_status,
+        "payload_bytes": 0,
+        **overrides.get(name, {}),
+    }
+
+def build_app(platform: FakePlatform, args, overrides: dict) -> web.Application:
+    rng = random.Random(args.seed)
+
+    def route(name: str, handler):
+        settings = route_settings(args, overrides, name)
+
+        async def wrapped(request):
+            await asyncio.sleep(max(0.0, settings["latency"] + rng.uniform(-settings["jitter"], settings["jitter"])))
+            if rng.random() < settings["error_rate"]:
+                return web.json_response({"error": f"synthetic failure of {name}"}, status=settings["error_status"])
+            status, body = await handler(request)
+            if settings["payload_bytes"] and isinstance(body, dict):
+                body = {**body, "padding": "x" * settings["payload_bytes"]}
+            elif settings["payload_bytes"] and isinstance(body, list):
+                body = body + [{"padding": "x" * settings["payload_bytes"]}]
+            return web.json_response(body, status=status)
+        return wrapped
+
+    def not_found(kind, key):
+        return 404, {"error": f"{kind} {key} not found"}
+
+    async def info(request):
+        service = request.match_info["service"]
+        return 200, {"app_name": f"go-{service}", "version": "fake", "env": "local", "host": request.host}
+
+    async def payments(request):
+        card = request.query.get("card")
+        after = request.query.get("after", "")
+        if card not in platform.payments:
+            return not_found("card", card)
+        return 200, [payment for payment in platform.payments[card] if payment["payment_at"][:10] >= after]
+
+    async def create_payment(request):
+        payload = await request.json()
+        card = payload.get("card_number")
+        if card not in platform.cards:
+            return not_found("card", card)
+        payment = {**payload, "payment_id": f"PAY-{card}-{len(platform.payments[card])}",
+                   "status": "AUTHORIZED", "payment_at": datetime.now().isoformat()}
+        platform.payments[card].append(payment)
+        return 200, payment
+
+    async def get_account(request):
+        account = request.match_info["account"]
+        if account not in platform.accounts:
+            return not_found("account", account)
+        return 200, platform.accounts[account]
+
+    async def add_account(request):
+        payload = await request.json()
+        account = payload.get("account_id")
+        platform.accounts[account] = {**payload, "status": "ACTIVE", "created_at": datetime.now().isoformat()}
+        platform.person_accounts.setdefault(payload.get("person_id"), []).append(account)
+        platform.statements.setdefault(account, [])
+        return 200, platform.accounts[account]
+
+    async def list_accounts(request):
+        person = request.match_info["person"]
+        if person not in platform.person_accounts:
+            return not_found("person", person)
+        return 200, [platform.accounts[account] for account in platform.person_accounts[person]]
+
+    async def get_card(request):
+        card = request.match_info["card"]
+        if card not in platform.cards:
+            return not_found("card", card)
+        return 200, platform.cards[card]
+
+    async def add_card(request):
+        payload = await request.json()
+        card = payload.get("card_number")
+        platform.cards[card] = payload
+        platform.payments.setdefault(card, [])
+        return 200, payload
+
+    async def statement(request):
+        account = request.match_info["account"]
+        if account not in platform.accounts:
+            return not_found("account", account)
+        moviments = platform.statements[account]
+        balance = sum(m["amount"] if m["type"] in ("DEPOSIT", "CREDIT", "REFUND") else -m["amount"] for m in moviments)
+        return 200, {"account_balance": {"account_id": account, "currency": "BRL", "amount": round(balance, 2)},
+                     "list_moviment_statement": moviments}
+
+    async def moviment_transaction(request):
+        payload = await request.json()
+        account = (payload.get("account_from") or {}).get("account_id")
+        if account not in platform.accounts:
+            return not_found("account", account)
+        moviment = {"id": len(platform.statements[account]), "type": payload.get("type"),
+                    "currency": payload.get("currency"), "amount": payload.get("amount"),
+                    "transaction_at": datetime.now().isoformat()}
+        platform.statements[account].append(moviment)
+        return 200, moviment
+
+    async def person_of_account(request):
+        account = request.match_info["account"]
+        if account not in platform.accounts:
+            return not_found("account", account)
+        return 200, [platform.accounts[account]["person_id"]]
+
+    async def store_graph(request):
+        payload = await request.json()
+        platform.graph.append(payload)
+        return 200, {"stored": 1, "total": len(platform.graph)}
+
+    async def store_graph_bulk(request):
+        items = (await request.json()).get("items", [])
+        platform.graph.extend(items)
+        return 200, {"stored": len(items), "total": len(platform.graph)}
+
+    app = web.Application()
+    for service in SERVICES:
+        app.router.add_get(f"/{{service:{service}}}/info", route(f"{service}_info".replace("-", "_"), info))
+    app.router.add_get("/payment-gateway/payment", route("payment_list", payments))
+    app.router.add_post("/gateway-grpc/payment", route("payment_create", create_payment))
+    app.router.add_get("/account/get/{account}", route("account_get", get_account))
+    app.router.add_post("/account/add", route("account_add", add_account))
+    app.router.add_get("/account/list/{person}", route("account_list", list_accounts))
+    app.router.add_get("/card/card/{card}", route("card_get", get_card))
+    app.router.add_post("/card/card", route("card_create", add_card))
+    app.router.add_get("/ledger/movimentStatement/{account}", route("ledger_statement", statement))
+    app.router.add_post("/ledger/movimentTransaction", route("ledger_transaction", moviment_transaction))
+    app.router.add_get("/person/account/{account}", route("graph_person", person_of_account))
+    app.router.add_post("/graph", route("graph_store", store_graph))
+    app.router.add_post("/graph/bulk", route("graph_bulk", store_graph_bulk))
+    return app
+
+async def main(args):
+    overrides = {}
+    if args.routes:
+        with open(args.routes) as f:
+            overrides = json.load(f)
+
+    platform = FakePlatform(args.seed, args.persons, args.moviments)
+    runner = web.AppRunner(build_app(platform, args, overrides))
+    await runner.setup()
+
+    # one port per base url, so code_server keeps a connection budget per upstream host
+    bases = {"APEX_BASE_URL": args.apex_port, "GLOBAL_BASE_URL": args.global_port, "GRAPH_BASE_URL": args.graph_port}
+    for port in bases.values():
+        await web.TCPSite(runner, args.host, port).start()
+
+    print("-" * 45)
+    print(f"FAKE UPSTREAM {len(platform.accounts)} accounts, {len(platform.cards)} cards, seed {args.seed}")
+    for name, port in bases.items():
+        print(f"export {name}=http://{args.host}:{port}")
+    print(f"e.g. person P-0000 accounts {platform.person_accounts['P-0000']} card {next(iter(platform.cards))}")
+    print("-" * 45)
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--apex-port", type=int, default=9101)
+    parser.add_argument("--global-port", type=int, default=9102)
+    parser.add_argument("--graph-port", type=int, default=9103)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--persons", type=int, default=100)
+    parser.add_argument("--moviments", type=int, default=50, help="moviments per account statement")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per response")
+    parser.add_argument("--jitter", type=float, default=0.01, help="+/- seconds around the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--routes", help="json file with per-route latency, jitter, error_rate, error_status, payload_bytes")
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -35,8 +35,14 @@ import boto3
 from dotenv import load_dotenv
 from langchain_aws import ChatBedrock
 
+# tracing
+from servers.tracing import tracer_from_env, current_traceparent, TRACEPARENT, CLIENT
+
 # Create a Bedrock Runtime client in the AWS Region you want to use.
 load_dotenv()
+
+# spans are written to TRACE_FILE and/or TRACE_OTLP_ENDPOINT, the mcp servers continue the same trace
+tracer = tracer_from_env("client_agent")
 client = boto3.client("bedrock-runtime", region_name="us-east-1")
 
 # Set the model ID, e.g., Amazon Nova Lite.
@@ -83,22 +89,27 @@ class AgentState(TypedDict):
     topic_count: Annotated[int, add]
     session_info: Dict[str, Any]
 
-list_mcp_servers = MultiServerMCPClient(
-    {
-        "math": {
-            "url": "http://localhost:9001/mcp",
-            "transport": "streamable_http",
-        },
-        "general": {
-            "url": "http://localhost:9000/mcp",
-            "transport": "streamable_http",
-        },
-        "code": {
-            "url": "http://localhost:9002/mcp",
-            "transport": "streamable_http",
-        }        
-    }
-)
+def list_mcp_servers(headers: dict = None) -> MultiServerMCPClient:
+    """The mcp servers client, headers (e.g. the traceparent) are sent with every mcp request"""
+    return MultiServerMCPClient(
+        {
+            "math": {
+                "url": "http://localhost:9001/mcp",
+                "transport": "streamable_http",
+                "headers": headers,
+            },
+            "general": {
+                "url": "http://localhost:9000/mcp",
+                "transport": "streamable_http",
+                "headers": headers,
+            },
+            "code": {
+                "url": "http://localhost:9002/mcp",
+                "transport": "streamable_http",
+                "headers": headers,
+            }        
+        }
+    )
 
 ###########################  LLM models  #############################
 def llm_model(state: AgentState, llm_model_choice, mcp_server_url) -> AgentState:
@@ -110,17 +121,19 @@ def llm_model(state: AgentState, llm_model_choice, mcp_server_url) -> AgentState
             async with ClientSession(read, write) as session:
                 await session.initialize()
 
-                # Get tools
-                mcp_tools = await list_mcp_servers.get_tools()
+                with tracer.span("mcp agent", CLIENT, **{"mcp.server_url": mcp_server_url}):
+                    # Get tools, their calls carry the traceparent of this span
+                    mcp_tools = await list_mcp_servers({TRACEPARENT: current_traceparent()}).get_tools()
 
-                agent = create_react_agent(model=llm_model_choice, tools=mcp_tools)
-                response = await agent.ainvoke({"messages": state['query']})
-                return response['messages'][-1].content
+                    agent = create_react_agent(model=llm_model_choice, tools=mcp_tools)
+                    response = await agent.ainvoke({"messages": state['query']})
+                    return response['messages'][-1].content
 
     print("-" * 45)
     return asyncio.run(_run())
 
 ############################## Nodes #############################
+@tracer.traced("node router")
 def route_query(state: AgentState) -> AgentState:
     """ Classify the user's query into a specific domain using an LLM.
     Fall back to heuristic parsing if the LLM response is not valid JSON."""
@@ -176,7 +189,8 @@ def route_query(state: AgentState) -> AgentState:
     human = HumanMessage(content=f"Query: {query}")
 
     # Send the request to the LLM.
-    raw = llm_general.invoke([system, human])
+    with tracer.span("bedrock invoke", CLIENT, **{"llm.model": model_id_general}):
+        raw = llm_general.invoke([system, human])
     
     # Normalize the LLM response to a string.
     text = raw.content if hasattr(raw, 'content') else str(raw)
@@ -198,6 +212,7 @@ def route_query(state: AgentState) -> AgentState:
     
     return state
 
+@tracer.traced("node code")
 def handle_code_query(state: AgentState) -> AgentState:
     """Process query with code-specialized LLM"""
 
@@ -207,6 +222,7 @@ def handle_code_query(state: AgentState) -> AgentState:
     state['response'] = response
     return state
 
+@tracer.traced("node math")
 def handle_math_query(state: AgentState) -> AgentState:
     """Process query with math-specialized LLM"""
 
@@ -216,6 +232,7 @@ def handle_math_query(state: AgentState) -> AgentState:
     state['response'] = response
     return state
 
+@tracer.traced("node general")
 def handle_general_query(state: AgentState) -> AgentState:
     """Process query with general LLM"""
     
@@ -225,6 +242,7 @@ def handle_general_query(state: AgentState) -> AgentState:
     state['response'] = response
     return state
 
+@tracer.traced("node memory")
 def handle_memory(state: AgentState) -> Dict[str, Any]:
     """Chatbot node that maintains conversation context."""
 
@@ -317,8 +335,9 @@ for i, query in enumerate(test_queries, 1):
         
     print(f"Query: {i} => {query} \n")
 
-    # Run the agent
-    result = agent.invoke({'user_id':user_id ,'query': query, "topic_count": i}, thread_config)
+    # Run the agent, one trace per query
+    with tracer.span("agent query", **{"user.id": user_id, "query.number": i}):
+        result = agent.invoke({'user_id':user_id ,'query': query, "topic_count": i}, thread_config)
 
     # Print results with rich formatting
     print(f"Route: {result['route']}")
@@ -0,0 +1,100 @@
+import time
+import asyncio
+import logging
+
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class SwrCache:
+    """
+    TTL cache that serves stale values while a single background refresh runs.
+    At most maxsize keys are kept (least recently used evicted first), and an entry
+    older than max_stale is dropped, so a refresh failing for that long is seen by the readers.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 1024, max_stale: float = None):
+        self.ttl = ttl
+        self.max_stale = max_stale or ttl * 10
+        self._entries = LruTtlCache(maxsize=maxsize, ttl=self.max_stale)
+        self._refreshing = {}
+
+    async def get(self, key, loader, cacheable=lambda value: True) -> tuple:
+        """
+        Return (value, age in seconds) for key.
+
+        The first read of a key (or the first after max_stale) waits on loader, afterwards
+        an expired entry is returned as is and refreshed in the background.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            value = await loader()
+            if cacheable(value):
+                self._entries.set(key, (value, time.monotonic()))
+            return value, 0.0
+
+        value, stored_at = entry
+        age = time.monotonic() - stored_at
+        if age > self.ttl and key not in self._refreshing:
+            task = asyncio.create_task(self._refresh(key, loader, cacheable))
+            self._refreshing[key] = task
+        return value, age
+
+    async def _refresh(self, key, loader, cacheable):
+        try:
+            value = await loader()
+            if cacheable(value):
+                self._entries.set(key, (value, time.monotonic()))
+        except Exception as e:
+            logger.warning("background refresh of %s failed: %s", key, e)
+        finally:
+            self._refreshing.pop(key, None)
+
+    def invalidate(self, key):
+        self._entries.invalidate(lambda entry_key: entry_key == key)
+
+    def stats(self) -> dict:
+        return {**self._entries.stats(), "refreshing": len(self._refreshing)}
+
+class LruTtlCache:
+    """Bounded LRU cache whose entries also expire after ttl seconds"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, predicate):
+        """Drop every key for which predicate(key) is true"""
+        for key in [key for key in self._entries if predicate(key)]:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+        }
@@ -0,0 +1,99 @@
+import time
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit of its service is open"""
+
+    def __init__(self, service: str, retry_after: float):
+        super().__init__(f"circuit of {service} is open, retry after {retry_after:.1f}s")
+        self.service = service
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Closed -> open after failure_threshold consecutive failures.
+    Open -> half-open after reset_timeout, where half_open_calls probes are let through:
+    a successful probe closes the circuit, a failed one opens it again.
+    """
+
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+    def __init__(self,
+                 service: str,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 30,
+                 half_open_calls: int = 1):
+        self.service = service
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.probe_started_at = 0.0
+        self.rejected = 0
+
+    def before_call(self):
+        """Raise CircuitOpenError when the call must fail fast"""
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(self.service, self.reset_timeout - (now - self.opened_at))
+            self.state = self.HALF_OPEN
+            self.probes = 0
+
+        if self.state == self.HALF_OPEN:
+            # a probe that never reported back (e.g. cancelled) does not block the circuit forever
+            if self.probes >= self.half_open_calls and now - self.probe_started_at < self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(self.service, self.reset_timeout - (now - self.probe_started_at))
+            if self.probes >= self.half_open_calls:
+                self.probes = 0
+            self.probes += 1
+            self.probe_started_at = now
+
+    def release(self):
+        """Give back the probe slot of a call let through by before_call that never reached the service"""
+        if self.state == self.HALF_OPEN and self.probes:
+            self.probes -= 1
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probes = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        snapshot = {
+            "state": self.state,
+            "failures": self.failures,
+            "rejected": self.rejected,
+        }
+        if self.state == self.OPEN:
+            snapshot["retry_after_seconds"] = round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 1)
+        return snapshot
+
+class CircuitBreakers:
+    """One CircuitBreaker per upstream service, created on first use"""
+
+    def __init__(self, **settings):
+        self.settings = settings
+        self._breakers = {}
+
+    def get(self, service: str) -> CircuitBreaker:
+        breaker = self._breakers.get(service)
+        if breaker is None:
+            breaker = CircuitBreaker(service, **self.settings)
+            self._breakers[service] = breaker
+        return breaker
+
+    def snapshot(self) -> dict:
+        return {service: breaker.snapshot() for service, breaker in self._breakers.items()}
@@ -1,132 +1,702 @@
 import os
+import re
+import json
+import time
+import random
+import hashlib
+import asyncio
 import logging
 import aiohttp
 
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
 from datetime import datetime
 
 from mcp.server.fastmcp import FastMCP
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from http_pool import HttpPool, UpstreamBusyError, SingleFlight
+from circuit_breaker import CircuitBreakers, CircuitOpenError
+from hedging import LatencyTracker, HedgeBudget, hedged
+from jwt_claims import JwtInspector, JwtError
+from cache import SwrCache, LruTtlCache
+from statement import find_moviments, find_closing_balance, summarize_moviments
+from result_encoder import encode_result
+from spool import DurableSpool
+from log_pipeline import setup_logging
+from metrics import Metrics, SIZE_BUCKETS, instrument_tools, add_metrics_route
+from tracing import tracer_from_env, trace_tools, TRACEPARENT, CLIENT
+from serving import serve
 
 PORT = os.getenv("PORT", "9002")
 HOST = os.getenv("HOST", "127.0.0.1")
-SESSION_TIMEOUT = 600 
+# processes sharing PORT, see serving.serve, WORKER_INDEX is set by serve in each worker
+WORKERS = int(os.getenv("WORKERS", "1"))
+WORKER_INTERNAL_PORT = int(os.getenv("WORKER_INTERNAL_PORT", "0")) or None
+WORKER_INDEX = os.getenv("WORKER_INDEX")
+# stateless: no mcp session is kept between requests and responses are plain JSON,
+# so any worker or replica serves any request. Stateful sessions left open by
+# clients are evicted after MCP_SESSION_IDLE_TIMEOUT, at most MCP_MAX_SESSIONS are kept
+MCP_STATELESS = os.getenv("MCP_STATELESS", "false").lower() == "true"
+MCP_JSON_RESPONSE = os.getenv("MCP_JSON_RESPONSE", str(MCP_STATELESS)).lower() == "true"
+MCP_SESSION_IDLE_TIMEOUT = float(os.getenv("MCP_SESSION_IDLE_TIMEOUT", "300"))
+MCP_MAX_SESSIONS = int(os.getenv("MCP_MAX_SESSIONS", "1000"))
+# upstream platform, point them to assets/utils/fake_upstream.py to run offline
+APEX_BASE_URL = os.getenv("APEX_BASE_URL", "https://go-global-apex.architecture.caradhras.io").rstrip("/")
+GLOBAL_BASE_URL = os.getenv("GLOBAL_BASE_URL", "https://go-global.architecture.caradhras.io").rstrip("/")
+GRAPH_BASE_URL = os.getenv("GRAPH_BASE_URL", "http://localhost:8001").rstrip("/")
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "10"))
+UPSTREAM_READ_DEADLINE = float(os.getenv("UPSTREAM_READ_DEADLINE", "15"))
+UPSTREAM_WRITE_DEADLINE = float(os.getenv("UPSTREAM_WRITE_DEADLINE", "30"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "3"))
+RETRY_BASE_BACKOFF = float(os.getenv("RETRY_BASE_BACKOFF", "0.1"))
+RETRY_MAX_BACKOFF = float(os.getenv("RETRY_MAX_BACKOFF", "2"))
+RETRY_STATUS = {500, 502, 503, 504}
+# a write failing with these may have reached the upstream, its outcome is unknown
+IN_DOUBT_STATUS = {502, 504}
+HEALTH_DEADLINE = float(os.getenv("HEALTH_DEADLINE", "5"))
+STATEMENT_DEADLINE = float(os.getenv("STATEMENT_DEADLINE", "30"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+BREAKER_HALF_OPEN_CALLS = int(os.getenv("BREAKER_HALF_OPEN_CALLS", "1"))
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.05"))
+HEDGE_BUDGET_BURST = float(os.getenv("HEDGE_BUDGET_BURST", "10"))
+IDEMPOTENCY_WINDOW = float(os.getenv("IDEMPOTENCY_WINDOW", "120"))
+IDEMPOTENCY_STORE_SIZE = int(os.getenv("IDEMPOTENCY_STORE_SIZE", "10000"))
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "1024"))
+JWT_LEEWAY = float(os.getenv("JWT_LEEWAY", "30"))
+# scopes a token must carry per tool, e.g. {"create_payment": ["payment:write"]}
+JWT_REQUIRED_SCOPES = json.loads(os.getenv("JWT_REQUIRED_SCOPES", "{}"))
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "50"))
+HTTP_KEEPALIVE_TIMEOUT = int(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "30"))
+HEALTH_CACHE_SIZE = int(os.getenv("HEALTH_CACHE_SIZE", "1024"))
+# past this age a health entry is dropped, the read waits on the service and reports its failure
+HEALTH_MAX_STALE = float(os.getenv("HEALTH_MAX_STALE", "120"))
+HEALTH_FANOUT_DEADLINE = float(os.getenv("HEALTH_FANOUT_DEADLINE", "5"))
+ENTITY_CACHE_SIZE = int(os.getenv("ENTITY_CACHE_SIZE", "1024"))
+ENTITY_CACHE_TTL = float(os.getenv("ENTITY_CACHE_TTL", "60"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BULK_PAYMENT_CONCURRENCY = int(os.getenv("BULK_PAYMENT_CONCURRENCY", "8"))
+GRAPH_WRITE_BEHIND = os.getenv("GRAPH_WRITE_BEHIND", "true").lower() == "true"
+GRAPH_BATCH_SIZE = int(os.getenv("GRAPH_BATCH_SIZE", "50"))
+GRAPH_BATCH_DELAY = float(os.getenv("GRAPH_BATCH_DELAY", "0.5"))
+GRAPH_MAX_PENDING = int(os.getenv("GRAPH_MAX_PENDING", "100000"))
+GRAPH_SPOOL_PATH = os.getenv("GRAPH_SPOOL_PATH", "spool/graph.db")
+GRAPH_DRAIN_CONCURRENCY = int(os.getenv("GRAPH_DRAIN_CONCURRENCY", "4"))
+GRAPH_MAX_ATTEMPTS = int(os.getenv("GRAPH_MAX_ATTEMPTS", "20"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_JSON = os.getenv("LOG_JSON", "false").lower() == "true"
+LOG_MAX_ARG_LENGTH = int(os.getenv("LOG_MAX_ARG_LENGTH", "200"))
+LOG_MAX_MSG_LENGTH = int(os.getenv("LOG_MAX_MSG_LENGTH", "1000"))
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# connection and concurrency budget per upstream host, so a slow ledger
+# or graph service can not take the sockets of the payment traffic
+UPSTREAM_BUDGETS = {
+    HttpPool.origin(APEX_BASE_URL): {
+        "max_connections": int(os.getenv("APEX_MAX_CONNECTIONS", "50")),
+        "max_concurrency": int(os.getenv("APEX_MAX_CONCURRENCY", "50")),
+        "max_queue_wait": float(os.getenv("APEX_MAX_QUEUE_WAIT", "10")),
+    },
+    HttpPool.origin(GLOBAL_BASE_URL): {
+        "max_connections": int(os.getenv("GLOBAL_MAX_CONNECTIONS", "30")),
+        "max_concurrency": int(os.getenv("GLOBAL_MAX_CONCURRENCY", "30")),
+        "max_queue_wait": float(os.getenv("GLOBAL_MAX_QUEUE_WAIT", "10")),
+    },
+    HttpPool.origin(GRAPH_BASE_URL): {
+        "max_connections": int(os.getenv("GRAPH_MAX_CONNECTIONS", "10")),
+        "max_concurrency": int(os.getenv("GRAPH_MAX_CONCURRENCY", "10")),
+        "max_queue_wait": float(os.getenv("GRAPH_MAX_QUEUE_WAIT", "5")),
+    },
+}
+
+# the total of each request is the remaining deadline of its call, see request_upstream
+session_timeout = aiohttp.ClientTimeout(total=None,
+                                        sock_connect=UPSTREAM_CONNECT_TIMEOUT,
+                                        sock_read=UPSTREAM_READ_TIMEOUT)
+
+http_pool_ready = False
+
+def init_http_pool():
+    """Configure the pool and the host budgets once per process, configure_host refuses hosts with requests in flight"""
+    global http_pool_ready
+    if http_pool_ready:
+        return
+    http_pool_ready = True
+    HttpPool.initialize(session_timeout,
+                        limit=HTTP_POOL_LIMIT,
+                        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+                        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT)
+    for origin, budget in UPSTREAM_BUDGETS.items():
+        HttpPool.configure_host(origin, **budget)
+
+# the FastMCP lifespan is entered once per mcp session on streamable-http (once per
+# request when stateless), so it only makes sure the pool is configured, the process shutdown closes it
+@asynccontextmanager
+async def lifespan(server: FastMCP):
+    init_http_pool()
+    yield {}
 
 mcp = FastMCP(name="code_server",        
         host=HOST,
         port=PORT,
         debug=True,
+        lifespan=lifespan,
+        stateless_http=MCP_STATELESS,
+        json_response=MCP_JSON_RESPONSE,
+        session_idle_timeout=MCP_SESSION_IDLE_TIMEOUT,
+        max_sessions=MCP_MAX_SESSIONS,
     )
 
-session_timeout = aiohttp.ClientTimeout(total=SESSION_TIMEOUT)
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging: records are queued on the event loop and formatted
+# (arguments capped first) and written by a listener thread
+log_handler = setup_logging(level=LOG_LEVEL,
+                            json_output=LOG_JSON,
+                            max_arg_length=LOG_MAX_ARG_LENGTH,
+                            max_msg_length=LOG_MAX_MSG_LENGTH,
+                            debug_sample_rate=LOG_DEBUG_SAMPLE_RATE,
+                            queue_size=LOG_QUEUE_SIZE)
 logger = logging.getLogger(__name__)
 
-# truncate logging
-class TruncatingFormatter(logging.Formatter):
-    def __init__(self, fmt=None, datefmt=None, style='%', max_msg_length=100):
-        super().__init__(fmt, datefmt, style)
-        self.max_msg_length = max_msg_length
+# -----------------------------------------------------
+# Http helpers
+# -----------------------------------------------------
+jwt_inspector = JwtInspector(maxsize=JWT_CACHE_SIZE, leeway=JWT_LEEWAY)
+
+def check_jwt(jwt_token: str, 
+              tool: str) -> str:
+    """The error message when the token is malformed, expired or misses a scope required by tool, else None"""
+    try:
+        jwt_inspector.check(jwt_token, JWT_REQUIRED_SCOPES.get(tool, ()))
+    except JwtError as e:
+        return f"{e}, NOT AUTHORIZED, statuscode: {e.status}"
+    return None
+
+def jwt_fingerprint(jwt_token: str) -> str:
+    """Hash of the whole token, the caller scope of cached upstream answers (the claims are not verified here)"""
+    return hashlib.sha256(jwt_token.encode()).hexdigest()
+
+metrics = Metrics("code_server")
+
+# spans are written to TRACE_FILE and/or TRACE_OTLP_ENDPOINT, the traceparent is always propagated
+tracer = tracer_from_env("code_server")
+
+single_flight = SingleFlight()
+
+breakers = CircuitBreakers(failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                           reset_timeout=BREAKER_RESET_TIMEOUT,
+                           half_open_calls=BREAKER_HALF_OPEN_CALLS)
+
+def upstream_service(url: str) -> str:
+    """Circuit breaker key of a url: graph for the memory service, else the first path segment (card, ledger, ...)"""
+    if HttpPool.origin(url) == HttpPool.origin(GRAPH_BASE_URL):
+        return "graph"
+    return urlsplit(url).path.strip("/").split("/")[0]
+
+latencies = LatencyTracker()
+hedge_budget = HedgeBudget(ratio=HEDGE_BUDGET_RATIO, burst=HEDGE_BUDGET_BURST)
+
+async def send_upstream(method: str, 
+                        url: str, 
+                        headers: dict, 
+                        payload: dict, 
+                        remaining: float) -> tuple:
+    """Send one request through the shared HttpPool session of the url host, within remaining seconds"""
+
+    async with HttpPool.slot(url, timeout=remaining):
+        session = HttpPool.get_session(url)
+        timeout = aiohttp.ClientTimeout(total=remaining,
+                                        sock_connect=UPSTREAM_CONNECT_TIMEOUT,
+                                        sock_read=UPSTREAM_READ_TIMEOUT)
+        host = HttpPool.origin(url)
+        metrics.inc("upstream_requests_total", "Upstream requests", host=host, method=method)
+        metrics.gauge("upstream_in_flight", "Upstream requests in progress", 1, host=host)
+        start = time.perf_counter()
+        status = None
+        try:
+            with tracer.span(f"{method} {host}", CLIENT, **{"http.method": method, "http.url": url}) as span:
+                headers = {**headers, TRACEPARENT: span.traceparent}
+                async with session.request(method, url, headers=headers, json=payload, timeout=timeout) as resp:
+                    status = resp.status
+                    span.set_attribute("http.status_code", status)
+                    if resp.status == 200:
+                        body = await resp.read()
+                        data = await resp.json()
+                        latencies.record(upstream_service(url), time.perf_counter() - start)
+                        metrics.observe("upstream_response_bytes", len(body), "Upstream response size",
+                                        buckets=SIZE_BUCKETS, host=host)
+                        return resp.status, data
+                    span.set_error(f"statuscode: {status}")
+                    return resp.status, None
+        finally:
+            metrics.gauge("upstream_in_flight", "Upstream requests in progress", -1, host=host)
+            metrics.observe("upstream_duration_seconds", time.perf_counter() - start,
+                            "Upstream request latency", host=host, method=method)
+            if status != 200:
+                metrics.inc("upstream_errors_total", "Upstream requests failing or not answering 200",
+                            host=host, status=status or "error")
+
+async def request_upstream(method: str, 
+                           url: str, 
+                           headers: dict, 
+                           payload: dict = None,
+                           deadline: float = None) -> tuple:
+    """
+    Send a request to an upstream within deadline seconds (UPSTREAM_READ_DEADLINE or UPSTREAM_WRITE_DEADLINE by default).
+    GETs failing with a 5xx, a timeout or a connection error are retried with jittered exponential backoff,
+    as long as the next attempt still starts inside the deadline.
+    While the circuit breaker of the upstream service is open the call fails fast, a call (retries
+    included) records one outcome on the breaker, none when it never reached the upstream.
+
+    Response:
+        - tuple: http status code and the decoded json body (None when status is not 200).
+          503 when the upstream host has no free slot within its budget, 504 when the deadline
+          expires and 502 when the upstream can not be reached.
+          503 with a CIRCUIT_OPEN error body when the circuit breaker rejects the call.
+    """
+
+    if deadline is None:
+        deadline = UPSTREAM_READ_DEADLINE if method == "GET" else UPSTREAM_WRITE_DEADLINE
+
+    loop = asyncio.get_running_loop()
+    expires_at = loop.time() + deadline
+    breaker = breakers.get(upstream_service(url))
+    try:
+        breaker.before_call()
+    except CircuitOpenError as e:
+        logger.warning("upstream rejected: %s", e)
+        return 503, {"error": "CIRCUIT_OPEN",
+                     "service": e.service,
+                     "retry_after_seconds": round(e.retry_after, 1)}
+
+    attempt = 0
+    status = None
+    while True:
+        try:
+            status, data = await send_upstream(method, url, headers, payload, expires_at - loop.time())
+        except UpstreamBusyError as e:
+            logger.warning("upstream busy: %s", e)
+            if status is None:
+                breaker.release()
+            else:
+                breaker.record_failure()
+            return 503, None
+        except asyncio.CancelledError:
+            # e.g. the losing request of a hedge, its outcome is unknown
+            breaker.release()
+            raise
+        except asyncio.TimeoutError:
+            logger.warning("upstream timeout: %s %s", method, url)
+            HttpPool.count(url, "timeouts")
+            status, data = 504, None
+        except aiohttp.ClientConnectionError as e:
+            logger.warning("upstream connection error: %s %s %s", method, url, e)
+            HttpPool.count(url, "errors")
+            status, data = 502, None
+
+        if method != "GET" or status not in RETRY_STATUS or attempt >= UPSTREAM_MAX_RETRIES:
+            break
+
+        backoff = random.uniform(0, min(RETRY_MAX_BACKOFF, RETRY_BASE_BACKOFF * 2 ** attempt))
+        if loop.time() + backoff >= expires_at:
+            break
+
+        attempt += 1
+        HttpPool.count(url, "retries")
+        try:
+            await asyncio.sleep(backoff)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+
+    if status >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return status, data
+
+async def fetch_upstream(method: str, 
+                         url: str, 
+                         headers: dict, 
+                         payload: dict = None,
+                         deadline: float = None,
+                         hedge: bool = False) -> tuple:
+    """
+    Send a request to an upstream, concurrent identical GETs (same url and token) share one request.
+    With hedge (and HEDGE_ENABLED) a GET not answered within the p95 latency of its service is sent
+    a second time, the first answer wins, as long as the hedge budget allows it.
+
+    Response:
+        - tuple: http status code and the decoded json body (None when status is not 200).
+    """
+
+    if method != "GET":
+        return await request_upstream(method, url, headers, payload, deadline)
+
+    async def call():
+        if not (hedge and HEDGE_ENABLED):
+            return await request_upstream(method, url, headers, deadline=deadline)
+        delay = max(HEDGE_MIN_DELAY, latencies.p95(upstream_service(url)) or HEDGE_MIN_DELAY)
+        return await hedged(lambda: request_upstream(method, url, headers, deadline=deadline), delay, hedge_budget)
+
+    principal = jwt_fingerprint(headers.get("Authorization", "").removeprefix("Bearer "))
+    return await single_flight.do((url, principal), call)
+
+idempotency_store = LruTtlCache(maxsize=IDEMPOTENCY_STORE_SIZE, ttl=IDEMPOTENCY_WINDOW * 2)
+idempotent_writes = SingleFlight()
+
+def idempotency_keys(jwt_token: str, 
+                     operation: str,
+                     idempotency_key: str, 
+                     *fields) -> list:
+    """
+    Keys under which a write is deduplicated, scoped by token fingerprint and operation
+    (the same idempotency_key sent to two tools names two different writes).
+    Without an explicit idempotency_key the key is derived from fields and the current
+    IDEMPOTENCY_WINDOW time bucket, the previous bucket is also checked so a retry
+    right after a bucket boundary is still recognized.
+    """
+    scope = jwt_fingerprint(jwt_token)
+    if idempotency_key:
+        return [f"{scope}:{operation}:{idempotency_key}"]
+    digest = hashlib.sha256("|".join(str(field) for field in fields).encode()).hexdigest()
+    bucket = int(time.time() // IDEMPOTENCY_WINDOW)
+    return [f"{scope}:{operation}:{digest}:{bucket}", f"{scope}:{operation}:{digest}:{bucket - 1}"]
+
+async def idempotent_post(keys: list, 
+                          url: str, 
+                          headers: dict, 
+                          payload: dict) -> tuple:
+    """
+    POST once per idempotency key: a repeated submission gets the stored original result,
+    a concurrent one waits on the in-flight POST. Successful results are stored, so is a
+    timeout or connection failure (IN_DOUBT_STATUS): the write may have been applied, so
+    until the key expires a repeated submission gets a 409 IN_DOUBT instead of a second POST.
+
+    Response:
+        - tuple: http status code and the decoded json body (None when status is not 200).
+    """
+
+    for key in keys:
+        stored = idempotency_store.get(key)
+        if stored is not None:
+            logger.info("idempotent replay of %s, statuscode: %s", url, stored[0])
+            return stored
+
+    async def post():
+        idempotency_header = hashlib.sha256(keys[0].encode()).hexdigest()
+        status, data = await fetch_upstream("POST", url, {**headers, "Idempotency-Key": idempotency_header}, payload)
+        if status == 200:
+            idempotency_store.set(keys[0], (status, data))
+        elif status in IN_DOUBT_STATUS:
+            idempotency_store.set(keys[0], (409, {"error": "IN_DOUBT",
+                                                  "detail": f"a previous attempt failed with statuscode {status} and may "
+                                                            "have been applied, check it before submitting again "
+                                                            "with a new idempotency_key"}))
+        return status, data
+
+    return await idempotent_writes.do(keys[0], post)
+
+def upstream_error(message_error: str, 
+                   data) -> str:
+    """The tool error message, as JSON with the error detail when the upstream call returned one"""
+    if isinstance(data, dict) and "error" in data:
+        return encode_result({**data, "message": message_error})
+    return message_error
+
+# the tool error messages: "Failed to ..., statuscode: N" and "..., NOT AUTHORIZED, statuscode: N"
+TOOL_ERROR = re.compile(r"(Failed to .*|.*, NOT AUTHORIZED), statuscode: \d+", re.S)
+# the same message as the last key of the upstream_error JSON (e.g. a CIRCUIT_OPEN body)
+TOOL_ERROR_JSON = re.compile(r'\{.*"message":"Failed to [^"]*, statuscode: \d+"\}', re.S)
+
+def is_tool_error(result) -> bool:
+    """True for a tool result that is one of the error messages, not for a result carrying per item errors"""
+    return isinstance(result, str) and bool(TOOL_ERROR.fullmatch(result) or TOOL_ERROR_JSON.fullmatch(result))
+
+health_cache = SwrCache(ttl=HEALTH_CACHE_TTL, maxsize=HEALTH_CACHE_SIZE, max_stale=HEALTH_MAX_STALE)
+
+async def fetch_health(url: str, 
+                       headers: dict) -> tuple:
+    """
+    Get a service /info through the health cache, once warm it only waits on the network
+    again when the entry is older than HEALTH_MAX_STALE (its refreshes kept failing).
+    Entries are kept per token, so the background refresh is sent with the headers of that caller.
+
+    Response:
+        - tuple: http status code and the /info body with its cache_age_seconds.
+    """
+
+    key = (url, jwt_fingerprint(headers.get("Authorization", "").removeprefix("Bearer ")))
+    (status, data), age = await health_cache.get(key,
+                                                 lambda: fetch_upstream("GET", url, headers, deadline=HEALTH_DEADLINE),
+                                                 cacheable=lambda result: result[0] == 200)
+    if status == 200:
+        if not isinstance(data, dict):
+            data = {"info": data}
+        data = {**data, "cache_age_seconds": round(age, 1)}
+    return status, data
+
+entity_cache = LruTtlCache(maxsize=ENTITY_CACHE_SIZE, ttl=ENTITY_CACHE_TTL)
+
+async def fetch_entity(kind: str, 
+                       entity_id: str, 
+                       url: str, 
+                       headers: dict, 
+                       jwt_token: str,
+                       hedge: bool = False) -> tuple:
+    """
+    Read-through entity_cache for a GET of one entity, keyed by (kind, entity_id, token fingerprint).
+
+    Response:
+        - tuple: http status code and the decoded json body (None when status is not 200).
+    """
 
-    def format(self, record):
-        if len(record.msg) > self.max_msg_length:
-            record.msg = record.msg[:self.max_msg_length] + "..."
-        return super().format(record)
+    key = (kind, entity_id, jwt_fingerprint(jwt_token))
+    data = entity_cache.get(key)
+    if data is not None:
+        return 200, data
 
-handler = logging.StreamHandler()
-formatter = TruncatingFormatter('%(asctime)s - %(levelname)s - %(message)s', max_msg_length=250)
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+    status, data = await fetch_upstream("GET", url, headers, hedge=hedge)
+    if status == 200:
+        entity_cache.set(key, data)
+    return status, data
+
+def invalidate_entity(kind: str, 
+                      entity_id: str):
+    """Drop a cached entity for every token after a write"""
+    entity_cache.invalidate(lambda key: key[0] == kind and key[1] == entity_id)
+
+async def fetch_batch(ids: list, 
+                      fetch_one, 
+                      concurrency: int = None) -> dict:
+    """
+    Run fetch_one(id) for every id with at most concurrency calls in flight.
+
+    Response:
+        - dict: results with the body per id and errors with the failure per id.
+    """
+
+    semaphore = asyncio.Semaphore(concurrency or BATCH_CONCURRENCY)
+
+    async def one(entity_id):
+        async with semaphore:
+            try:
+                return await fetch_one(entity_id)
+            except Exception as e:
+                return None, str(e)
+
+    ids = list(dict.fromkeys(ids))
+    responses = await asyncio.gather(*(one(entity_id) for entity_id in ids))
+
+    batch = {"results": {}, "errors": {}}
+    for entity_id, (status, data) in zip(ids, responses):
+        if status == 200:
+            batch["results"][entity_id] = data
+        elif isinstance(data, dict):
+            batch["errors"][entity_id] = data
+        else:
+            batch["errors"][entity_id] = f"statuscode: {status}" if status else data
+    return batch
+
+async def flush_graph_writes(authorization: str, 
+                             payloads: list) -> int:
+    """
+    Post a batch of graph payloads to the bulk endpoint of the graph memory service, returns the http status code.
+
+    Contract: POST /graph/bulk {"items": [<the /graph payload>, ...]} answers 200 when all items are stored.
+    """
+
+    url = f"{GRAPH_BASE_URL}/graph/bulk"
+    status, _ = await request_upstream("POST", url, {"Authorization": authorization}, {"items": payloads})
+    if status != 200:
+        logger.error("Failed to post %s graph items, statuscode: %s", len(payloads), status)
+    return status
+
+def graph_spool(path: str) -> DurableSpool:
+    return DurableSpool(path,
+                        flush_graph_writes,
+                        max_batch=GRAPH_BATCH_SIZE,
+                        max_delay=GRAPH_BATCH_DELAY,
+                        max_pending=GRAPH_MAX_PENDING,
+                        concurrency=GRAPH_DRAIN_CONCURRENCY,
+                        max_attempts=GRAPH_MAX_ATTEMPTS)
+
+# each worker drains its own spool file, two drainers on one file would flush the same rows
+spool_root, spool_ext = os.path.splitext(GRAPH_SPOOL_PATH)
+if WORKER_INDEX is not None:
+    graph_spool_path = f"{spool_root}-{WORKER_INDEX}{spool_ext}"
+    live_spool_paths = {f"{spool_root}-{worker}{spool_ext}" for worker in range(WORKERS)}
+else:
+    graph_spool_path = GRAPH_SPOOL_PATH
+    live_spool_paths = {GRAPH_SPOOL_PATH}
+
+graph_writes = graph_spool(graph_spool_path)
+
+def orphan_graph_spools() -> list:
+    """
+    Spools no running process owns (graph.db of a single process run, graph-N.db of a run
+    with more workers), adopted by worker 0 or the single process so their rows are still replayed.
+    """
+    if WORKER_INDEX not in (None, "0"):
+        return []
+    directory = os.path.dirname(GRAPH_SPOOL_PATH) or "."
+    if not os.path.isdir(directory):
+        return []
+    pattern = re.compile(re.escape(os.path.basename(spool_root)) + r"(-\d+)?" + re.escape(spool_ext))
+    paths = [os.path.join(os.path.dirname(GRAPH_SPOOL_PATH), name) for name in sorted(os.listdir(directory))
+             if pattern.fullmatch(name)]
+    return [graph_spool(path) for path in paths if path not in live_spool_paths]
+
+orphan_spools = []
+
+async def store_graph(url: str, 
+                      headers: dict, 
+                      payload: dict) -> tuple:
+    """
+    Store a graph payload, with GRAPH_WRITE_BEHIND it is spooled on disk and acknowledged at once.
+
+    Response:
+        - tuple: http status code and the graph service body, or the ACCEPTED payload when spooled.
+    """
+
+    if not GRAPH_WRITE_BEHIND:
+        return await fetch_upstream("POST", url, headers, payload)
+
+    await graph_writes.submit(headers["Authorization"], payload)
+    return 200, {"status": "ACCEPTED", **payload}
+
+@mcp.custom_route("/caches", methods=["GET"])
+async def caches(request: Request) -> JSONResponse:
+    """Counters of the entity and health caches, single-flight sharing, idempotency store, jwt claims cache and graph spools lag"""
+    return JSONResponse({"entity": entity_cache.stats(),
+                         "health": health_cache.stats(),
+                         "single_flight": single_flight.stats(),
+                         "idempotency": idempotency_store.stats(),
+                         "jwt_claims": jwt_inspector.stats(),
+                         "graph_spool": graph_writes.lag(),
+                         "orphan_graph_spools": {spool.path: spool.lag() for spool in orphan_spools}})
+
+@mcp.custom_route("/breakers", methods=["GET"])
+async def circuit_breakers(request: Request) -> JSONResponse:
+    """Circuit breaker state per upstream service"""
+    return JSONResponse(breakers.snapshot())
+
+@mcp.custom_route("/hedging", methods=["GET"])
+async def hedging(request: Request) -> JSONResponse:
+    """Hedge budget counters and the p95 latency used as hedge delay per upstream service"""
+    return JSONResponse({"enabled": HEDGE_ENABLED,
+                         **hedge_budget.stats,
+                         "tokens": round(hedge_budget.tokens, 2),
+                         "p95_seconds": latencies.snapshot()})
+
+@mcp.custom_route("/upstreams", methods=["GET"])
+async def upstreams(request: Request) -> JSONResponse:
+    """Connection budgets, in-flight and queue-wait stats per upstream host"""
+    return JSONResponse(HttpPool.stats())
 
 # -----------------------------------------------------
 # Gateway_GRPC
 # -----------------------------------------------------
 @mcp.tool(name="gateway_grpc_healthy")
-async def gateway_grpc_healthy(context: dict = None) -> str:
+async def gateway_grpc_healthy(fields: list[str] = None,
+                               context: dict = None) -> str:
     """
     Check the healthy status of GATEWAY_GRPC service.
     
     Args:
+        - fields: optional list of attributes to return, the default value returns all attributes.
         - context: context with a jwt embedded.
     Response:
-        - content: all information about GATEWAY_GRPC service healthy status and enviroment variables.
+        - content: all information about GATEWAY_GRPC service healthy status and enviroment variables, with the cache_age_seconds.
     Raises:
         - valueError: http status code.
     """
 
-    print('\033[31m =.=.= \033[0m' * 15)
-    logger.info(f"function => gateway_grpc_healthy()")
+    logger.info("function => gateway_grpc_healthy()")
 
     jwt_token = context.get("jwt") if context else None
     if not jwt_token:
         message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
         logger.error("message_error")
         return message_error
+
+    message_error = check_jwt(jwt_token, "gateway_grpc_healthy")
+    if message_error:
+        logger.error(message_error)
+        return message_error
  
-    logger.info(f"jwt_token: {jwt_token}")
+    logger.debug("jwt_token: %.12s...", jwt_token)
     
     headers = {"Authorization": f"Bearer {jwt_token}"}                  
-    url = f"https://go-global-apex.architecture.caradhras.io/gateway-grpc/info"
+    url = f"{APEX_BASE_URL}/gateway-grpc/info"
     
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.get(url, headers=headers) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                
-                logger.info(f"data: {data}")
-                
-                return f"{data}"
-            else:
-                message_error = f"Failed to fetch gateway_grp healthy, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
+    status, data = await fetch_health(url, headers)
+    if status == 200:
+        logger.info("data: %s", data)
+
+        return encode_result(data, fields)
+    else:
+        message_error = f"Failed to fetch gateway_grp healthy, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
   
 # -----------------------------------------------------          
 # Payment_Gateway
 # -----------------------------------------------------
 @mcp.tool(name="payment_healthy")
-async def payment_healthy(context: dict = None) -> str:
+async def payment_healthy(fields: list[str] = None,
+                          context: dict = None) -> str:
     """
     Check the healthy status PAYMENT service.
 
     Args:
+        - fields: optional list of attributes to return, the default value returns all attributes.
         - context: context with a jwt embedded.
     Response:
-        - content: all information about PAYMENT service healthy status and enviroment variables.
+        - content: all information about PAYMENT service healthy status and enviroment variables, with the cache_age_seconds.
     Raises:
         - valueError: http status code.
     """
 
-    print('\033[31m =.=.= \033[0m' * 15)
-    logger.info(f"function => payment_healthy()")
+    logger.info("function => payment_healthy()")
     
     jwt_token = context.get("jwt") if context else None
     if not jwt_token:
         message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
         logger.error("message_error")
         return message_error
+
+    message_error = check_jwt(jwt_token, "payment_healthy")
+    if message_error:
+        logger.error(message_error)
+        return message_error
  
-    logger.info(f"jwt_token: {jwt_token}")
+    logger.debug("jwt_token: %.12s...", jwt_token)
     
     headers = {"Authorization": f"Bearer {jwt_token}"}                  
-    url = f"https://go-global-apex.architecture.caradhras.io/payment-gateway/info"
+    url = f"{APEX_BASE_URL}/payment-gateway/info"
     
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.get(url, headers=headers) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                                
-                logger.info(f"data: {data}")
-                
-                return f"{data}"
-            else:
-                message_error = f"Failed to fetch payment_gateway healthy, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
+    status, data = await fetch_health(url, headers)
+    if status == 200:
+        logger.info("data: %s", data)
+
+        return encode_result(data, fields)
+    else:
+        message_error = f"Failed to fetch payment_gateway healthy, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
 
 @mcp.tool(name="get_card_payment")
 async def get_card_payment(card: str, 
                            date: str, 
+                           fields: list[str] = None,
                            context: dict = None) -> str:
     """
     Get all PAYMENT did by a card such as payments amount, currency, payment date, card number used to pay, mcc (merchant), etc.
@@ -134,6 +704,7 @@ async def get_card_payment(card: str,
     Args:
         - card: Exactly 12 digits split into 4 groups of 3 digits each.
         - date: search date in format YYYY-MM-DD.
+        - fields: optional list of attributes to return, the default value returns all attributes.
         - context: context with a jwt embedded.        
     Response:
         - list: A list of payments with information such as card type, card model, payment amount, terminal, payment status and payment date.
@@ -141,8 +712,7 @@ async def get_card_payment(card: str,
         - valueError: http status code.
     """
 
-    print('\033[31m =.=.= \033[0m' * 15)
-    logger.info(f"function => get_card_payment() card:{card} date:{date} ")
+    logger.info("function => get_card_payment() card:%s date:%s ", card, date)
     
     jwt_token = context.get("jwt") if context else None
     if not jwt_token:
@@ -150,23 +720,25 @@ async def get_card_payment(card: str,
         logger.error("message_error")
         return message_error
 
-    logger.info(f"jwt_token: {jwt_token}")
+    message_error = check_jwt(jwt_token, "get_card_payment")
+    if message_error:
+        logger.error(message_error)
+        return message_error
+
+    logger.debug("jwt_token: %.12s...", jwt_token)
     
     headers = {"Authorization": f"Bearer {jwt_token}"}                  
-    url = f"https://go-global-apex.architecture.caradhras.io/payment-gateway/payment?card={card}&after={date}"
+    url = f"{APEX_BASE_URL}/payment-gateway/payment?card={card}&after={date}"
     
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.get(url, headers=headers) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-
-                logger.info(f"data: {data}")
-                
-                return f"{data}"
-            else:
-                message_error = f"Failed to fetch payment {card} : {date}, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
+    status, data = await fetch_upstream("GET", url, headers, hedge=True)
+    if status == 200:
+        logger.info("data: %s", data)
+
+        return encode_result(data, fields)
+    else:
+        message_error = f"Failed to fetch payment {card} : {date}, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
 
 @mcp.tool(name="create_payment")
 async def create_payment(card: str,
@@ -175,9 +747,13 @@ async def create_payment(card: str,
                         mcc: str,
                         currency: str,
                         amount: float,
+                        idempotency_key: str = None,
                         context: dict = None) -> str:
     """
     Create a payment.
+    The same payment (card, terminal, mcc, currency, amount) submitted again within a couple of minutes
+    is treated as a retry and returns the original payment, use a new idempotency_key for a real second payment.
+    When an earlier attempt timed out its outcome is unknown and the retry returns IN_DOUBT (statuscode: 409) instead.
 
     Args:
         - card: Exactly 12 digits split into 4 groups of 3 digits each.
@@ -186,6 +762,7 @@ async def create_payment(card: str,
         - mcc: merchant (FOOD, GAS, COMPUTE, PET, LIBRARY, etc)
         - currency: payment currency as BRL, the default value is BRL.
         - amount: payment amount (float). 
+        - idempotency_key: optional key identifying this payment, the default value is derived from the payment.
         - context: context with a jwt embedded.        
     Response:
         - card: a card created. 
@@ -193,16 +770,20 @@ async def create_payment(card: str,
         - valueError: http status code.
     """
 
-    print('\033[31m =.=.= \033[0m' * 15)
-    logger.info(f"function => create_payment() = card: {card} : {type} : {terminal} : {mcc} : {currency} : {amount}")
+    logger.info("function => create_payment() = card: %s : %s : %s : %s : %s : %s", card, type, terminal, mcc, currency, amount)
 
     jwt_token = context.get("jwt") if context else None
     if not jwt_token:
         message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
         logger.error("message_error")
         return message_error
+
+    message_error = check_jwt(jwt_token, "create_payment")
+    if message_error:
+        logger.error(message_error)
+        return message_error
  
-    logger.info(f"jwt_token: {jwt_token}")
+    logger.debug("jwt_token: %.12s...", jwt_token)
 
     payload = {
         "card_number": card,
@@ -214,113 +795,196 @@ async def create_payment(card: str,
     }
 
     headers = {"Authorization": f"Bearer {jwt_token}"}                  
-    url = "https://go-global-apex.architecture.caradhras.io/gateway-grpc/payment"
+    url = f"{APEX_BASE_URL}/gateway-grpc/payment"
+    keys = idempotency_keys(jwt_token, "create_payment", idempotency_key, card, type, terminal, mcc, currency, amount)
     
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.post(url, headers=headers, json=payload) as resp:
-            if resp.status == 200:
-                data = await resp.json()
+    status, data = await idempotent_post(keys, url, headers, payload)
+    if status == 200:
+        logger.info("data: %s", data)
+
+        return encode_result(data)
+    else:
+        message_error = f"Failed to create payment {card}, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
+            
+@mcp.tool(name="create_payments_bulk")
+async def create_payments_bulk(payments: list[dict],
+                               context: dict = None) -> str:
+    """
+    Create many payments at once, use it instead of calling create_payment once per payment.
 
-                logger.info(f"data: {data}")
+    Args:
+        - payments: list of payments, each one with card, type, terminal, mcc, currency, amount and optionally idempotency_key
+          (same meaning and default values as in create_payment). Without an idempotency_key the derived key includes
+          the index of the payment, so identical payments of one list are all created, and the same list submitted
+          again is treated as a retry.
+        - context: context with a jwt embedded.
+    Response:
+        - total, succeeded, failed: payment counters.
+        - items: per payment (index in the list) the status code, latency in ms and the payment created or the error.
+    Raises:
+        - valueError: http status code.
+    """
+
+    logger.info("function => create_payments_bulk() = payments: %s", len(payments))
+
+    jwt_token = context.get("jwt") if context else None
+    if not jwt_token:
+        message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
+        logger.error("message_error")
+        return message_error
+
+    message_error = check_jwt(jwt_token, "create_payments_bulk")
+    if message_error:
+        logger.error(message_error)
+        return message_error
+
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    url = f"{APEX_BASE_URL}/gateway-grpc/payment"
+    semaphore = asyncio.Semaphore(BULK_PAYMENT_CONCURRENCY)
+
+    async def create_one(index: int, spec: dict) -> dict:
+        spec = {"type": "CREDIT", "currency": "BRL", **spec}
+        missing = [field for field in ("card", "terminal", "mcc", "amount") if spec.get(field) is None]
+        if missing:
+            return {"index": index, "status": 400, "error": f"missing fields: {missing}"}
+
+        payload = {
+            "card_number": spec["card"],
+            "card_type": spec["type"],
+            "terminal": spec["terminal"],
+            "mcc": spec["mcc"],
+            "currency": spec["currency"],
+            "amount": spec["amount"]
+        }
+        # the same namespace as create_payment, an explicit key is shared by both tools
+        keys = idempotency_keys(jwt_token, "create_payment", spec.get("idempotency_key"), "bulk", index,
+                                spec["card"], spec["type"], spec["terminal"], spec["mcc"], spec["currency"], spec["amount"])
+
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                status, data = await idempotent_post(keys, url, headers, payload)
+            except Exception as e:
+                status, data = None, str(e)
+            latency_ms = round((time.perf_counter() - start) * 1000, 1)
+
+        if status == 200:
+            return {"index": index, "status": status, "latency_ms": latency_ms, "payment": data}
+        return {"index": index, "status": status, "latency_ms": latency_ms,
+                "error": data if data is not None else f"Failed to create payment {spec['card']}, statuscode: {status}"}
+
+    items = await asyncio.gather(*(create_one(index, spec) for index, spec in enumerate(payments)))
+    succeeded = sum(1 for item in items if item["status"] == 200)
+
+    data = {"total": len(items), "succeeded": succeeded, "failed": len(items) - succeeded, "items": items}
+
+    logger.info("data: %s payments, %s failed", data['total'], data['failed'])
+
+    return encode_result(data)
 
-                return f"{data}"
-            else:
-                message_error = f"Failed to create payment {card}, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
-            
 # -----------------------------------------------------                        
 # Limit
 # -----------------------------------------------------
 @mcp.tool(name="limit_healthy")
-async def limit_healthy(context: dict = None) -> str:
+async def limit_healthy(fields: list[str] = None,
+                        context: dict = None) -> str:
     """
     Check the healthy status LIMIT service.
 
     Args:
+        - fields: optional list of attributes to return, the default value returns all attributes.
         - context: context with a jwt embedded.
     Response:
-        - content: all information about LIMIT service health status and enviroment variables.
+        - content: all information about LIMIT service health status and enviroment variables, with the cache_age_seconds.
     Raises:
         - valueError: http status code.
     """
 
-    print('\033[31m =.=.= \033[0m' * 15) 
-    logger.info(f"function => limit_healthy()")
+    logger.info("function => limit_healthy()")
 
     jwt_token = context.get("jwt") if context else None
     if not jwt_token:
         message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
         logger.error("message_error")
         return message_error
+
+    message_error = check_jwt(jwt_token, "limit_healthy")
+    if message_error:
+        logger.error(message_error)
+        return message_error
  
-    logger.debug(f"jwt_token: {jwt_token}")
+    logger.debug("jwt_token: %.12s...", jwt_token)
     
     headers = {"Authorization": f"Bearer {jwt_token}"}                   
-    url = f"https://go-global.architecture.caradhras.io/limit/info"
+    url = f"{GLOBAL_BASE_URL}/limit/info"
     
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.get(url, headers=headers) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-
-                logger.info(f"data: {data}")
+    status, data = await fetch_health(url, headers)
+    if status == 200:
+        logger.info("data: %s", data)
 
-                return f"{data}"
-            else:
-                message_error = f"Failed to fetch limit healthy, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
+        return encode_result(data, fields)
+    else:
+        message_error = f"Failed to fetch limit healthy, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
 
 # -----------------------------------------------------            
 # Card
 # -----------------------------------------------------
 @mcp.tool(name="card_healthy")
-async def card_healthy(context: dict = None) -> str:
+async def card_healthy(fields: list[str] = None,
+                       context: dict = None) -> str:
     """
     Check the healthy status CARD service.
 
     Args:
+        - fields: optional list of attributes to return, the default value returns all attributes.
         - context: context with a jwt embedded.
     Response:
-        - content: all information about CARD service health status and enviroment variables.
+        - content: all information about CARD service health status and enviroment variables, with the cache_age_seconds.
     Raises:
         - valueError: http status code.
     """
 
-    print('\033[31m =.=.= \033[0m' * 15)
-    logger.info(f"function => card_healthy()")
+    logger.info("function => card_healthy()")
 
     jwt_token = context.get("jwt") if context else None
     if not jwt_token:
         message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
         logger.error("message_error")
         return message_error
+
+    message_error = check_jwt(jwt_token, "card_healthy")
+    if message_error:
+        logger.error(message_error)
+        return message_error
  
-    logger.info(f"jwt_token: {jwt_token}")
+    logger.debug("jwt_token: %.12s...", jwt_token)
     
     headers = {"Authorization": f"Bearer {jwt_token}"}                  
-    url = f"https://go-global.architecture.caradhras.io/card/info"
+    url = f"{GLOBAL_BASE_URL}/card/info"
     
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.get(url, headers=headers) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                logger.info(f"data: {data}")
-                return f"{data}"
-            else:
-                message_error = f"Failed to fetch card healthy, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
+    status, data = await fetch_health(url, headers)
+    if status == 200:
+        logger.info("data: %s", data)
+        return encode_result(data, fields)
+    else:
+        message_error = f"Failed to fetch card healthy, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
             
 @mcp.tool(name="get_card")
 async def get_card(card: str, 
+                   fields: list[str] = None,
                    context: dict = None) -> str:
     """
     Get all CARD details such as card number, atc, card type, card model (CREDIT or DEBIT), card status from a given card number.
 
     Args:
         - card: Exactly 12 digits split into 4 groups of 3 digits each.
+        - fields: optional list of attributes to return, the default value returns all attributes.
         - context: context with a jwt embedded.
     Response:
         - card: all card information.
@@ -328,30 +992,75 @@ async def get_card(card: str,
         - valueError: http status code.
     """
 
-    print('\033[31m =.=.= \033[0m' * 15)
-    logger.info(f"function => get_card() = card:{card}")
+    logger.info("function => get_card() = card:%s", card)
 
     jwt_token = context.get("jwt") if context else None
     if not jwt_token:
         message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
         logger.error("message_error")
         return message_error
+
+    message_error = check_jwt(jwt_token, "get_card")
+    if message_error:
+        logger.error(message_error)
+        return message_error
  
-    logger.info(f"jwt_token: {jwt_token}")
+    logger.debug("jwt_token: %.12s...", jwt_token)
     
     headers = {"Authorization": f"Bearer {jwt_token}"}                  
-    url = f"https://go-global.architecture.caradhras.io/card/card/{card}"
+    url = f"{GLOBAL_BASE_URL}/card/card/{card}"
     
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.get(url, headers=headers) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                logger.info(f"data: {data}")
-                return f"{data}"
-            else:
-                message_error = f"Failed to fetch card from {card}, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
+    status, data = await fetch_entity("card", card, url, headers, jwt_token)
+    if status == 200:
+        logger.info("data: %s", data)
+        return encode_result(data, fields)
+    else:
+        message_error = f"Failed to fetch card from {card}, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
+
+@mcp.tool(name="get_cards")
+async def get_cards(cards: list[str], 
+                    fields: list[str] = None,
+                    context: dict = None) -> str:
+    """
+    Get CARD details of many cards at once, use it instead of calling get_card once per card.
+
+    Args:
+        - cards: list of cards, each one exactly 12 digits split into 4 groups of 3 digits each.
+        - fields: optional list of attributes to return, the default value returns all attributes.
+        - context: context with a jwt embedded.
+    Response:
+        - results: card information per card.
+        - errors: failure status per card that could not be fetched.
+    Raises:
+        - valueError: http status code.
+    """
+
+    logger.info("function => get_cards() = cards:%s", cards)
+
+    jwt_token = context.get("jwt") if context else None
+    if not jwt_token:
+        message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
+        logger.error("message_error")
+        return message_error
+
+    message_error = check_jwt(jwt_token, "get_cards")
+    if message_error:
+        logger.error(message_error)
+        return message_error
+
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+
+    async def fetch_card(card):
+        url = f"{GLOBAL_BASE_URL}/card/card/{card}"
+        return await fetch_entity("card", card, url, headers, jwt_token)
+
+    data = await fetch_batch(cards, fetch_card)
+
+    logger.info("data: %s", data)
+
+    return encode_result(data, fields)
 
 @mcp.tool(name="create_card")
 async def create_card(card: str,
@@ -378,16 +1087,20 @@ async def create_card(card: str,
         - valueError: http status code.
     """
 
-    print('\033[31m =.=.= \033[0m' * 15)
-    logger.info(f"function => create_account() = card: {card} account: {account}")
+    logger.info("function => create_account() = card: %s account: %s", card, account)
 
     jwt_token = context.get("jwt") if context else None
     if not jwt_token:
         message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
         logger.error("message_error")
         return message_error
+
+    message_error = check_jwt(jwt_token, "create_card")
+    if message_error:
+        logger.error(message_error)
+        return message_error
  
-    logger.info(f"jwt_token: {jwt_token}")
+    logger.debug("jwt_token: %.12s...", jwt_token)
 
     payload = {
         "card_number": card,
@@ -399,66 +1112,68 @@ async def create_card(card: str,
     }
 
     headers = {"Authorization": f"Bearer {jwt_token}"}                  
-    url = f"https://go-global.architecture.caradhras.io/card/card"
+    url = f"{GLOBAL_BASE_URL}/card/card"
     
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.post(url, headers=headers, json=payload) as resp:
-            if resp.status == 200:
-                data = await resp.json()
+    status, data = await fetch_upstream("POST", url, headers, payload)
+    invalidate_entity("card", card)
+    if status == 200:
+        logger.info("data: %s", data)
 
-                logger.info(f"data: {data}")
-
-                return f"{data}"
-            else:
-                message_error = f"Failed to create card {card}, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
+        return encode_result(data)
+    else:
+        message_error = f"Failed to create card {card}, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
 
 # -----------------------------------------------------
 # Account
 # -----------------------------------------------------
 @mcp.tool(name="account_healthy")
-async def account_healthy(context: dict = None) -> str:
+async def account_healthy(fields: list[str] = None,
+                          context: dict = None) -> str:
     """
     Check the healthy status ACCOUNT service.
 
     Args:
+        - fields: optional list of attributes to return, the default value returns all attributes.
         - context: context with a jwt embedded.
     Response:
-        - content: all information about ACCOUNT service health status and enviroment variables.
+        - content: all information about ACCOUNT service health status and enviroment variables, with the cache_age_seconds.
     Raises:
         - valueError: http status code.
     """
 
-    print('\033[31m =.=.= \033[0m' * 15)
-    logger.info(f"function => account_healthy()")
+    logger.info("function => account_healthy()")
 
     jwt_token = context.get("jwt") if context else None
     if not jwt_token:
         message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
         logger.error("message_error")
         return message_error
+
+    message_error = check_jwt(jwt_token, "account_healthy")
+    if message_error:
+        logger.error(message_error)
+        return message_error
  
-    logger.info(f"jwt_token: {jwt_token}")
+    logger.debug("jwt_token: %.12s...", jwt_token)
     
     headers = {"Authorization": f"Bearer {jwt_token}"}                
-    url = f"https://go-global-apex.architecture.caradhras.io/account/info"
+    url = f"{APEX_BASE_URL}/account/info"
     
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.get(url, headers=headers) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                
-                logger.info(f"data: {data}")
-                
-                return f"{data}"
-            else:
-                message_error = f"Failed to fetch account healthy, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
+    status, data = await fetch_health(url, headers)
+    if status == 200:
+        logger.info("data: %s", data)
+
+        return encode_result(data, fields)
+    else:
+        message_error = f"Failed to fetch account healthy, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
            
 @mcp.tool(name="get_account")
 async def get_account(account: str, 
+                      fields: list[str] = None,
                       context: dict = None) -> str:
     """
     Get account details from a given account id.
@@ -466,6 +1181,7 @@ async def get_account(account: str,
 
     Args:
         - account: account identificator (account id).
+        - fields: optional list of attributes to return, the default value returns all attributes.
         - context: context with a jwt embedded.        
     Response:
         - account: account details such as account id (account_id), person id (owner account), date of creation (created_at).
@@ -473,32 +1189,77 @@ async def get_account(account: str,
         - valueError: http status code.
     """
 
-    print('\033[31m =.=.= \033[0m' * 15)
-    logger.info(f"function => get_account() = account: {account}")
+    logger.info("function => get_account() = account: %s", account)
 
     jwt_token = context.get("jwt") if context else None
     if not jwt_token:
         message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
         logger.error("message_error")
         return message_error
+
+    message_error = check_jwt(jwt_token, "get_account")
+    if message_error:
+        logger.error(message_error)
+        return message_error
  
-    logger.info(f"jwt_token: {jwt_token}")
+    logger.debug("jwt_token: %.12s...", jwt_token)
     
     headers = {"Authorization": f"Bearer {jwt_token}"}                  
-    url = f"https://go-global-apex.architecture.caradhras.io/account/get/{account}"
+    url = f"{APEX_BASE_URL}/account/get/{account}"
     
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.get(url, headers=headers) as resp:
-            if resp.status == 200:
-                data = await resp.json()
+    status, data = await fetch_entity("account", account, url, headers, jwt_token, hedge=True)
+    if status == 200:
+        logger.info("data: %s", data)
+
+        return encode_result(data, fields)
+    else:
+        message_error = f"Failed to fetch account from {account}, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
+
+@mcp.tool(name="get_accounts")
+async def get_accounts(accounts: list[str], 
+                       fields: list[str] = None,
+                       context: dict = None) -> str:
+    """
+    Get account details of many accounts at once, use it instead of calling get_account once per account.
+    All accounts has a pattern ACC-### or ACC-###.### 
 
-                logger.info(f"data: {data}")
+    Args:
+        - accounts: list of account identificators (account id).
+        - fields: optional list of attributes to return, the default value returns all attributes.
+        - context: context with a jwt embedded.
+    Response:
+        - results: account details per account id.
+        - errors: failure status per account id that could not be fetched.
+    Raises:
+        - valueError: http status code.
+    """
 
-                return f"{data}"
-            else:
-                message_error = f"Failed to fetch account from {account}, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
+    logger.info("function => get_accounts() = accounts: %s", accounts)
+
+    jwt_token = context.get("jwt") if context else None
+    if not jwt_token:
+        message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
+        logger.error("message_error")
+        return message_error
+
+    message_error = check_jwt(jwt_token, "get_accounts")
+    if message_error:
+        logger.error(message_error)
+        return message_error
+
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+
+    async def fetch_account(account):
+        url = f"{APEX_BASE_URL}/account/get/{account}"
+        return await fetch_entity("account", account, url, headers, jwt_token)
+
+    data = await fetch_batch(accounts, fetch_account)
+
+    logger.info("data: %s", data)
+
+    return encode_result(data, fields)
 
 @mcp.tool(name="create_account")
 async def create_account(account: str,
@@ -520,16 +1281,20 @@ async def create_account(account: str,
         - valueError: http status code.
     """
 
-    print('\033[31m =.=.= \033[0m' * 15)
-    logger.info(f"function => create_account() = account: {account} person: {person}")
+    logger.info("function => create_account() = account: %s person: %s", account, person)
 
     jwt_token = context.get("jwt") if context else None
     if not jwt_token:
         message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
         logger.error("message_error")
         return message_error
+
+    message_error = check_jwt(jwt_token, "create_account")
+    if message_error:
+        logger.error(message_error)
+        return message_error
  
-    logger.info(f"jwt_token: {jwt_token}")
+    logger.debug("jwt_token: %.12s...", jwt_token)
 
     payload = {
         "account_id": account,
@@ -537,23 +1302,23 @@ async def create_account(account: str,
     }
 
     headers = {"Authorization": f"Bearer {jwt_token}"}                  
-    url = f"https://go-global-apex.architecture.caradhras.io/account/add"
+    url = f"{APEX_BASE_URL}/account/add"
     
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.post(url, headers=headers, json=payload) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-
-                logger.info(f"data: {data}")
-
-                return f"{data}"
-            else:
-                message_error = f"Failed to create account {account}, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
+    status, data = await fetch_upstream("POST", url, headers, payload)
+    invalidate_entity("account", account)
+    invalidate_entity("person_accounts", person)
+    if status == 200:
+        logger.info("data: %s", data)
+
+        return encode_result(data)
+    else:
+        message_error = f"Failed to create account {account}, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
 
 @mcp.tool(name="get_account_from_person")
 async def get_account_from_person(person: str, 
+                                  fields: list[str] = None,
                                   context: dict = None) -> str:
     """
     Get all accounts associated/belongs a given person (person_id).
@@ -561,6 +1326,7 @@ async def get_account_from_person(person: str,
 
     Args:
         - person: person identificator (person_id).
+        - fields: optional list of attributes to return, the default value returns all attributes.
         - context: context with a jwt embedded.
     Response:
         - list: List of accounts owned/belongs by a given person (person id).
@@ -568,83 +1334,153 @@ async def get_account_from_person(person: str,
         - valueError: http status code.
     """
 
-    print('\033[31m =.=.= \033[0m' * 15)
-    logger.info(f"function => get_account_from_person() = person: {person}")
+    logger.info("function => get_account_from_person() = person: %s", person)
 
     jwt_token = context.get("jwt") if context else None
     if not jwt_token:
         message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
         logger.error("message_error")
         return message_error
+
+    message_error = check_jwt(jwt_token, "get_account_from_person")
+    if message_error:
+        logger.error(message_error)
+        return message_error
  
-    logger.info(f"jwt_token: {jwt_token}")
+    logger.debug("jwt_token: %.12s...", jwt_token)
     
     headers = {"Authorization": f"Bearer {jwt_token}"}   
-    url = f"https://go-global-apex.architecture.caradhras.io/account/list/{person}"
+    url = f"{APEX_BASE_URL}/account/list/{person}"
     
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.get(url, headers=headers) as resp:
-
-            if resp.status == 200:
-                data = await resp.json()
-                
-                logger.info(f"data: {data}")
-                
-                return f"{data}"
-            else:
-                message_error = f"Failed to fetch account from {person}, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
+    status, data = await fetch_entity("person_accounts", person, url, headers, jwt_token)
+    if status == 200:
+        logger.info("data: %s", data)
+
+        return encode_result(data, fields)
+    else:
+        message_error = f"Failed to fetch account from {person}, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
          
+@mcp.tool(name="get_person_portfolio")
+async def get_person_portfolio(person: str, 
+                               fields: list[str] = None,
+                               context: dict = None) -> str:
+    """
+    Get in one call all accounts of a given person (person_id) with the account details and LEDGER statement of each account.
+    Use it instead of calling get_account_from_person, get_account and get_account_statement one by one.
+    The person has a pattern P-### or P-###.###
+
+    Args:
+        - person: person identificator (person_id).
+        - fields: optional list of attributes to return, the default value returns all attributes.
+        - context: context with a jwt embedded.
+    Response:
+        - results: per account id, the account details and its statement.
+        - errors: failure status per account id that could not be fetched.
+    Raises:
+        - valueError: http status code.
+    """
+
+    logger.info("function => get_person_portfolio() = person: %s", person)
+
+    jwt_token = context.get("jwt") if context else None
+    if not jwt_token:
+        message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
+        logger.error("message_error")
+        return message_error
+
+    message_error = check_jwt(jwt_token, "get_person_portfolio")
+    if message_error:
+        logger.error(message_error)
+        return message_error
+
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+    url = f"{APEX_BASE_URL}/account/list/{person}"
+
+    status, data = await fetch_entity("person_accounts", person, url, headers, jwt_token)
+    if status != 200:
+        message_error = f"Failed to fetch account from {person}, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
+
+    accounts = data if isinstance(data, list) else [data]
+    accounts = [account.get("account_id") if isinstance(account, dict) else account for account in accounts]
+
+    async def fetch_account_details(account):
+        account_url = f"{APEX_BASE_URL}/account/get/{account}"
+        statement_url = f"{APEX_BASE_URL}/ledger/movimentStatement/{account}"
+        (account_status, account_data), (statement_status, statement_data) = await asyncio.gather(
+            fetch_entity("account", account, account_url, headers, jwt_token),
+            fetch_upstream("GET", statement_url, headers, deadline=STATEMENT_DEADLINE),
+        )
+        if account_status != 200:
+            return account_status, account_data
+        if statement_status != 200 and not isinstance(statement_data, dict):
+            statement_data = f"statuscode: {statement_status}"
+        return 200, {"account": account_data, "statement": statement_data}
+
+    data = {"person": person, **await fetch_batch([account for account in accounts if account], fetch_account_details)}
+
+    logger.info("data: %s", data)
+
+    return encode_result(data, fields)
+
 # -----------------------------------------------------
 # Ledger Account bank statement
 # -----------------------------------------------------
 @mcp.tool(name="ledger_healthy")
-async def ledger_healthy(context: dict = None) -> str:
+async def ledger_healthy(fields: list[str] = None,
+                         context: dict = None) -> str:
     """
     Check the healthy status account LEDGER service.
 
     Args:
+        - fields: optional list of attributes to return, the default value returns all attributes.
         - context: context with a jwt embedded.    
     Response:
-        - content: all information about LEDGER service health status and enviroment variables.
+        - content: all information about LEDGER service health status and enviroment variables, with the cache_age_seconds.
     Raises:
         - valueError: http status code.
     """
 
-    print('\033[31m =.=.= \033[0m' * 15)
-    logger.info(f"function => ledger_healthy()")
+    logger.info("function => ledger_healthy()")
     
     jwt_token = context.get("jwt") if context else None
     if not jwt_token:
         message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
         logger.error("message_error")
         return message_error
+
+    message_error = check_jwt(jwt_token, "ledger_healthy")
+    if message_error:
+        logger.error(message_error)
+        return message_error
  
-    logger.info(f"jwt_token: {jwt_token}")
+    logger.debug("jwt_token: %.12s...", jwt_token)
     
     headers = {"Authorization": f"Bearer {jwt_token}"}                  
-    url = f"https://go-global-apex.architecture.caradhras.io/ledger/info"
+    url = f"{APEX_BASE_URL}/ledger/info"
     
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.get(url, headers=headers) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                logger.info(f"data: {data}")
-                return f"{data}"
-            else:
-                message_error = f"Failed to fetch ledger healthy, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
+    status, data = await fetch_health(url, headers)
+    if status == 200:
+        logger.info("data: %s", data)
+        return encode_result(data, fields)
+    else:
+        message_error = f"Failed to fetch ledger healthy, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
             
 @mcp.tool(name="get_account_statement")
 async def get_account_statement(account: str, 
+                                fields: list[str] = None,
                                 context: dict = None) -> str:
     """
     Get LEDGER informations such as account activity, account balances and statements from a given account (account id).
 
     Args:
         - account: account identificator (account_id).
+        - fields: optional list of attributes to return, the default value returns all attributes.
         - context: context with a jwt embedded.    
     Response:
         - list: A list of bank statement, financial moviment, account activity and balance summary.
@@ -652,64 +1488,128 @@ async def get_account_statement(account: str,
         - valueError: http status code.
     """
 
-    print('\033[31m =.=.= \033[0m' * 15)
-    logger.info(f"function => get_account_statement() = account: {account}")
+    logger.info("function => get_account_statement() = account: %s", account)
     
     jwt_token = context.get("jwt") if context else None
     if not jwt_token:
         message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
         logger.error("message_error")
         return message_error
+
+    message_error = check_jwt(jwt_token, "get_account_statement")
+    if message_error:
+        logger.error(message_error)
+        return message_error
  
-    logger.info(f"jwt_token: {jwt_token}")
+    logger.debug("jwt_token: %.12s...", jwt_token)
     
     headers = {"Authorization": f"Bearer {jwt_token}"}   
-    url = f"https://go-global-apex.architecture.caradhras.io/ledger/movimentStatement/{account}"
+    url = f"{APEX_BASE_URL}/ledger/movimentStatement/{account}"
     
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.get(url, headers=headers) as resp:
-            
-            if resp.status == 200:
-                data = await resp.json()
+    status, data = await fetch_upstream("GET", url, headers, deadline=STATEMENT_DEADLINE)
+    if status == 200:
+        logger.info("data: %s", data)
+
+        return encode_result(data, fields)
+    else:
+        message_error = f"Failed to fetch ledger account from {account}, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
+
+@mcp.tool(name="summarize_account_statement")
+async def summarize_account_statement(account: str, 
+                                      date_from: str = None,
+                                      date_to: str = None,
+                                      top: int = 5,
+                                      fields: list[str] = None,
+                                      context: dict = None) -> str:
+    """
+    Get a SUMMARY of the LEDGER statement of a given account (account id): totals, counts per moviment type, daily balances and the biggest moviments.
+    Prefer it over get_account_statement to summarize or answer questions about the statement.
 
-                logger.info(f"data: {data}")
+    Args:
+        - account: account identificator (account_id).
+        - date_from: optional first date in format YYYY-MM-DD.
+        - date_to: optional last date in format YYYY-MM-DD.
+        - top: how many of the biggest moviments to return, the default value is 5.
+        - fields: optional list of attributes to return, the default value returns all attributes.
+        - context: context with a jwt embedded.    
+    Response:
+        - summary: count, credits, debits, net, closing_balance (the current account balance), per_type (count and total),
+          daily_balances (per day the net and the account balance at its end, or only the cumulative_net of the period
+          when the ledger gives no account balance) and top_moviments.
+    Raises:
+        - valueError: http status code.
+    """
 
-                return f"{data}"
-            else:
-                message_error = f"Failed to fetch ledger account from {account}, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
+    logger.info("function => summarize_account_statement() = account: %s date_from: %s date_to: %s", account, date_from, date_to)
+
+    jwt_token = context.get("jwt") if context else None
+    if not jwt_token:
+        message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
+        logger.error("message_error")
+        return message_error
+
+    message_error = check_jwt(jwt_token, "summarize_account_statement")
+    if message_error:
+        logger.error(message_error)
+        return message_error
+
+    headers = {"Authorization": f"Bearer {jwt_token}"}   
+    url = f"{APEX_BASE_URL}/ledger/movimentStatement/{account}"
+
+    status, data = await fetch_upstream("GET", url, headers, deadline=STATEMENT_DEADLINE)
+    if status == 200:
+        summary = {"account": account, **summarize_moviments(find_moviments(data), date_from, date_to, top,
+                                                             closing_balance=find_closing_balance(data))}
+
+        logger.info("data: %s", summary)
+
+        return encode_result(summary, fields)
+    else:
+        message_error = f"Failed to fetch ledger account from {account}, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
 
 @mcp.tool(name="create_moviment_transaction")
 async def create_moviment_transaction(account: str,
                                       type: str,
                                       currency: str,
                                       amount: float,
+                                      idempotency_key: str = None,
                                       context: dict = None) -> str:
     """
     Create a transaction from a given account (account id).
+    The same transaction (account, type, currency, amount) submitted again within a couple of minutes
+    is treated as a retry and returns the original transaction, use a new idempotency_key for a real second transaction.
+    When an earlier attempt timed out its outcome is unknown and the retry returns IN_DOUBT (statuscode: 409) instead.
 
     Args:
         - account: account identificator (account_id) associated. A account pattern is ACC-###.### or ACC-###.
         - type: DEPOSIT or WITHDRAW, the default value is DEPOSIT.
         - currency: transaction currency as BRL, the default value is BRL.
         - amount: transaction amount. 
+        - idempotency_key: optional key identifying this transaction, the default value is derived from the transaction.
     Response:
          transaction: all transaction information.
     Raises:
         - valueError: http status code.
     """
 
-    print('\033[31m =.=.= \033[0m' * 15)
-    logger.info(f"function => create_moviment_transaction() = account: {account}: {type} : {currency} : {amount}")
+    logger.info("function => create_moviment_transaction() = account: %s: %s : %s : %s", account, type, currency, amount)
     
     jwt_token = context.get("jwt") if context else None
     if not jwt_token:
         message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
         logger.error("message_error")
         return message_error
+
+    message_error = check_jwt(jwt_token, "create_moviment_transaction")
+    if message_error:
+        logger.error(message_error)
+        return message_error
  
-    logger.info(f"jwt_token: {jwt_token}")
+    logger.debug("jwt_token: %.12s...", jwt_token)
 
     payload = {
         "account_from": {
@@ -720,37 +1620,105 @@ async def create_moviment_transaction(account: str,
         "amount": amount
     }
 
-    logger.info(f"payload: {payload}")
+    logger.info("payload: %s", payload)
 
     headers = {"Authorization": f"Bearer {jwt_token}"} 
 
-    url = f"https://go-global.architecture.caradhras.io/ledger/movimentTransaction"
+    url = f"{GLOBAL_BASE_URL}/ledger/movimentTransaction"
+    keys = idempotency_keys(jwt_token, "create_moviment_transaction", idempotency_key, account, type, currency, amount)
     
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.post(url, headers=headers, json=payload) as resp:
+    status, data = await idempotent_post(keys, url, headers, payload)
+    invalidate_entity("account", account)
+    if status == 200:
+        logger.info("data: %s", data)
+
+        return encode_result(data)
+    else:
+        message_error = f"Failed to create ledger a transaction moviment from {account}, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
             
-            if resp.status == 200:
-                data = await resp.json()
+# -----------------------------------------------------
+# Platform
+# -----------------------------------------------------
+HEALTH_ENDPOINTS = {
+    "gateway_grpc": f"{APEX_BASE_URL}/gateway-grpc/info",
+    "payment": f"{APEX_BASE_URL}/payment-gateway/info",
+    "limit": f"{GLOBAL_BASE_URL}/limit/info",
+    "card": f"{GLOBAL_BASE_URL}/card/info",
+    "account": f"{APEX_BASE_URL}/account/info",
+    "ledger": f"{APEX_BASE_URL}/ledger/info",
+}
+
+@mcp.tool(name="all_services_healthy")
+async def all_services_healthy(context: dict = None) -> str:
+    """
+    Check the healthy status of ALL payment platform services at once (GATEWAY_GRPC, PAYMENT, LIMIT, CARD, ACCOUNT and LEDGER).
+    Use it instead of calling each *_healthy tool when the question is about the whole platform.
+
+    Args:
+        - context: context with a jwt embedded.
+    Response:
+        - table: one line per service with its status (UP, DOWN or TIMEOUT), http status code and latency in ms.
+    Raises:
+        - valueError: http status code.
+    """
 
-                logger.info(f"data: {data}")
+    logger.info("function => all_services_healthy()")
+
+    jwt_token = context.get("jwt") if context else None
+    if not jwt_token:
+        message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
+        logger.error("message_error")
+        return message_error
+
+    message_error = check_jwt(jwt_token, "all_services_healthy")
+    if message_error:
+        logger.error(message_error)
+        return message_error
+
+    headers = {"Authorization": f"Bearer {jwt_token}"}
+
+    async def check(url: str) -> tuple:
+        start = time.perf_counter()
+        try:
+            status, _ = await fetch_upstream("GET", url, headers, deadline=HEALTH_FANOUT_DEADLINE)
+        except Exception as e:
+            logger.error("health check %s failed: %s", url, e)
+            status = None
+        return status, (time.perf_counter() - start) * 1000
+
+    tasks = {service: asyncio.create_task(check(url)) for service, url in HEALTH_ENDPOINTS.items()}
+    await asyncio.wait(tasks.values(), timeout=HEALTH_FANOUT_DEADLINE)
+
+    lines = [f"{'service':<14}{'status':<9}{'code':<6}latency_ms"]
+    for service, task in tasks.items():
+        if not task.done():
+            task.cancel()
+            lines.append(f"{service:<14}{'TIMEOUT':<9}{'-':<6}>{HEALTH_FANOUT_DEADLINE * 1000:.0f}")
+            continue
+        status, latency_ms = task.result()
+        state = "UP" if status == 200 else "DOWN"
+        lines.append(f"{service:<14}{state:<9}{status or '-':<6}{latency_ms:.0f}")
+
+    table = "\n".join(lines)
+    logger.info("data: %s", table)
+
+    return table
 
-                return f"{data}"
-            else:
-                message_error = f"Failed to create ledger a transaction moviment from {account}, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
-            
 # ------------------------------------------------------------------- #
 # Memory
 # ------------------------------------------------------------------- #
 @mcp.tool(name="retrieve_memory_graph_account")
 async def retrieve_memory_graph_account(account: str, 
+                                        fields: list[str] = None,
                                         context: dict = None) -> str:
     """
     Retrieve all ACCOUNT memories from knowledge base graph database.
 
     Args:
         - account: account id.
+        - fields: optional list of attributes to return, the default value returns all attributes.
         - context: context with a jwt embedded.    
     Response:
         - list: list of person_id (owner) of account.
@@ -758,34 +1726,34 @@ async def retrieve_memory_graph_account(account: str,
         - valueError: http status code.
     """
 
-    print('\033[1;33m =.=.= \033[0m' * 15)
-    logger.info(f"function => retrieve_memory_graph_account() = account: {account}")
+    logger.info("function => retrieve_memory_graph_account() = account: %s", account)
 
     jwt_token = context.get("jwt") if context else None
     if not jwt_token:
         message_error = "No JWT provided, NOT AUTHORIZED, statuscode: 403"
         logger.error("message_error")
         return message_error
+
+    message_error = check_jwt(jwt_token, "retrieve_memory_graph_account")
+    if message_error:
+        logger.error(message_error)
+        return message_error
  
-    logger.info(f"jwt_token: {jwt_token}")
+    logger.debug("jwt_token: %.12s...", jwt_token)
     
     headers = {"Authorization": f"Bearer {jwt_token}"}   
 
-    url = f"http://localhost:8001/person/account/{account}"
+    url = f"{GRAPH_BASE_URL}/person/account/{account}"
 
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.get(url, headers=headers) as resp:
-            
-            if resp.status == 200:
-                data = await resp.json()
+    status, data = await fetch_upstream("GET", url, headers)
+    if status == 200:
+        logger.info("data: %s", data)
 
-                logger.info(f"data: {data}")
-            
-                return f"{data}"
-            else:
-                message_error = f"Failed to get data from {account}, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
+        return encode_result(data, fields)
+    else:
+        message_error = f"Failed to get data from {account}, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
 
 @mcp.tool(name="store_account_memory")
 async def store_account_memory(person: str,
@@ -808,8 +1776,7 @@ async def store_account_memory(person: str,
         - valueError: http status code.
     """
 
-    print('\033[1;33m =.=.= \033[0m' * 15)
-    logger.info(f"function => store_account_memory() = person: {person} account: {account} relation: {relation}")
+    logger.info("function => store_account_memory() = person: %s account: %s relation: %s", person, account, relation)
 
     # set relation
     if relation is None:
@@ -834,29 +1801,26 @@ async def store_account_memory(person: str,
         },
     }
 
-    logger.info(f"payload: {payload}")
+    logger.info("payload: %s", payload)
 
     jwt_token = context.get("jwt") if context else None
     #if not jwt_token:
     #    logger.error( "No JWT provided, NOT AUTHORIZED, statuscode: 403")
     #    return "No JWT provided, NOT AUTHORIZED, statuscode: 403"
 
-    logger.info(f"jwt_token: {jwt_token}")
+    logger.debug("jwt_token: %.12s...", jwt_token)
     
     headers = {"Authorization": f"Bearer {jwt_token}"}   
-    url = f"http://localhost:8001/graph"
-
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.post(url, headers=headers, json=payload) as resp:
-            
-            if resp.status == 200:
-                data = await resp.json()
-                logger.debug(f"data: {data}")
-                return f"{data}"
-            else:
-                message_error = f"Failed to post data {account}, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
+    url = f"{GRAPH_BASE_URL}/graph"
+
+    status, data = await store_graph(url, headers, payload)
+    if status == 200:
+        logger.debug("data: %s", data)
+        return encode_result(data)
+    else:
+        message_error = f"Failed to post data {account}, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
             
 @mcp.tool(name="store_card_memory")
 async def store_card_memory(card: str,
@@ -883,8 +1847,7 @@ async def store_card_memory(card: str,
         - valueError: http status code.
     """
 
-    print('\033[1;33m =.=.= \033[0m' * 15)
-    logger.info(f"function => store_card_memory() = card: {card}:{type}:{model} account: {account} relation: {relation}")
+    logger.info("function => store_card_memory() = card: %s:%s:%s account: %s relation: %s", card, type, model, account, relation)
 
     # set relation
     if relation is None:
@@ -911,32 +1874,28 @@ async def store_card_memory(card: str,
         },
     }
 
-    logger.info(f"payload: {payload}")
+    logger.info("payload: %s", payload)
 
     jwt_token = context.get("jwt") if context else None
     #if not jwt_token:
     #    logger.error( "No JWT provided, NOT AUTHORIZED, statuscode: 403")
     #    return "No JWT provided, NOT AUTHORIZED, statuscode: 403"
  
-    logger.info(f"jwt_token: {jwt_token}")
+    logger.debug("jwt_token: %.12s...", jwt_token)
     
     headers = {"Authorization": f"Bearer {jwt_token}"}   
     
-    url = f"http://localhost:8001/graph"
-
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.post(url, headers=headers, json=payload) as resp:
-            
-            if resp.status == 200:
-                data = await resp.json()
+    url = f"{GRAPH_BASE_URL}/graph"
 
-                logger.info(f"data: {data}")
+    status, data = await store_graph(url, headers, payload)
+    if status == 200:
+        logger.info("data: %s", data)
 
-                return f"{data}"
-            else:
-                message_error = f"Failed to post data {account}, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
+        return encode_result(data)
+    else:
+        message_error = f"Failed to post data {account}, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
 
 @mcp.tool(name="store_payment_memory")
 async def store_payment_memory(card: str, 
@@ -968,8 +1927,7 @@ async def store_payment_memory(card: str,
         - valueError: http status code.
     """
 
-    print('\033[1;33m =.=.= \033[0m' * 15)
-    logger.info(f"function => store_payment_memory() = card:{card} payment:{payment} {payment_date} {mcc} {currency} {amount} relation:{relation} status:{status}")
+    logger.info("function => store_payment_memory() = card:%s payment:%s %s %s %s %s relation:%s status:%s", card, payment, payment_date, mcc, currency, amount, relation, status)
 
     # set relation
     if relation is None:
@@ -999,38 +1957,74 @@ async def store_payment_memory(card: str,
         },
     }
 
-    logger.info(f"payload: {payload}")
+    logger.info("payload: %s", payload)
     
     jwt_token = context.get("jwt") if context else None
     #if not jwt_token:
     #    logger.error( "No JWT provided, NOT AUTHORIZED, statuscode: 403")
     #    return "No JWT provided, NOT AUTHORIZED, statuscode: 403"
  
-    logger.info(f"jwt_token: {jwt_token}")
+    logger.debug("jwt_token: %.12s...", jwt_token)
     
     headers = {"Authorization": f"Bearer {jwt_token}"}   
-    url = f"http://localhost:8001/graph"
+    url = f"{GRAPH_BASE_URL}/graph"
 
-    async with aiohttp.ClientSession(timeout=session_timeout) as session:
-        async with session.post(url, headers=headers, json=payload) as resp:
-            
-            if resp.status == 200:
-                data = await resp.json()
-                
-                logger.info(f"data: {data}")
+    status, data = await store_graph(url, headers, payload)
+    if status == 200:
+        logger.info("data: %s", data)
 
-                return f"{data}"
-            else:
-                message_error = f"Failed to post data {card}, statuscode: {resp.status}"
-                logger.error(message_error)
-                return message_error
+        return encode_result(data)
+    else:
+        message_error = f"Failed to post data {card}, statuscode: {status}"
+        logger.error(message_error)
+        return upstream_error(message_error, data)
+
+# -----------------------------------------------------
+# Metrics
+# -----------------------------------------------------
+# tools return their errors as a message carrying the status code
+instrument_tools(mcp, metrics, is_error=is_tool_error)
+add_metrics_route(mcp, metrics)
+
+# -----------------------------------------------------
+# Tracing
+# -----------------------------------------------------
+# every tool continues the trace of the MCP request (params._meta or http traceparent)
+trace_tools(mcp, tracer)
 
 # ------------------------------------------------------------------- #
 # Main
 # ------------------------------------------------------------------- #
+def build_app():
+    """The streamable-http app, whose lifespan opens the http pool and the graph spool of the process"""
+    app = mcp.streamable_http_app()
+    session_manager_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def app_lifespan(app):
+        init_http_pool()
+        async with session_manager_lifespan(app):
+            graph_writes.start()
+            orphan_spools[:] = orphan_graph_spools()
+            for spool in orphan_spools:
+                logger.info("replaying orphan graph spool %s, %s pending", spool.path, spool.pending())
+                spool.start()
+            try:
+                yield
+            finally:
+                await graph_writes.close()
+                for spool in orphan_spools:
+                    await spool.close()
+                await HttpPool.close()
+
+    app.router.lifespan_context = app_lifespan
+    return app
+
 if __name__ == "__main__":
     print("-" * 45)
-    print(f"CODE SERVER {HOST}:{PORT}")
+    print(f"CODE SERVER {HOST}:{PORT} WORKERS {WORKERS} {'STATELESS' if MCP_STATELESS else 'STATEFUL'}")
     print("-" * 45)
-    
-    mcp.run(transport="streamable-http")    
\ No newline at end of file
+
+    # stateless requests need no session routing between workers
+    serve(build_app, HOST, PORT, workers=WORKERS, internal_port=WORKER_INTERNAL_PORT,
+          session_affinity=not MCP_STATELESS, log_level=mcp.settings.log_level.lower())
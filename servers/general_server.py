@@ -3,8 +3,13 @@ import json
 from datetime import datetime
 from mcp.server.fastmcp import FastMCP
 
+from metrics import Metrics, instrument_tools, add_metrics_route
+from serving import serve
+
 PORT = os.getenv("PORT", "9000")
 HOST = os.getenv("HOST", "127.0.0.1")
+WORKERS = int(os.getenv("WORKERS", "1"))
+WORKER_INTERNAL_PORT = int(os.getenv("WORKER_INTERNAL_PORT", "0")) or None
 
 mcp = FastMCP(name="general_server",        
         host=HOST,
@@ -12,6 +17,8 @@ mcp = FastMCP(name="general_server",
         debug=True,
     )
 
+metrics = Metrics("general_server")
+
 @mcp.tool(name="get_weather")
 def get_weather(location: str) -> str:
     """
@@ -72,11 +79,16 @@ def save_note(filename: str, content: str) -> str:
         return f'Note saved successfully to {filepath}'
     except Exception as e:
         return f'Error saving note: {str(e)}'
-    
+
+################## METRICS ###############################
+instrument_tools(mcp, metrics, is_error=lambda result: isinstance(result, str) and result.startswith("Error"))
+add_metrics_route(mcp, metrics)
+
+def build_app():
+    return mcp.streamable_http_app()
 
 if __name__ == "__main__":
     print("-" * 45)
-    print(f"GENERAL SERVER {HOST}:{PORT}")
+    print(f"GENERAL SERVER {HOST}:{PORT} WORKERS {WORKERS}")
     print("-" * 45)
-
-    mcp.run(transport="streamable-http")
\ No newline at end of file
+    serve(build_app, HOST, PORT, workers=WORKERS, internal_port=WORKER_INTERNAL_PORT, log_level=mcp.settings.log_level.lower())
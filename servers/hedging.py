@@ -0,0 +1,71 @@
+import asyncio
+
+from collections import deque
+
+class LatencyTracker:
+    """Rolling window of the latest latencies per key, to know its p95"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}
+
+    def record(self, key: str, seconds: float):
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = deque(maxlen=self.window)
+            self._samples[key] = samples
+        samples.append(seconds)
+
+    def p95(self, key: str):
+        """p95 latency in seconds, None until min_samples were recorded"""
+        samples = self._samples.get(key)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def snapshot(self) -> dict:
+        return {key: self.p95(key) for key in self._samples}
+
+class HedgeBudget:
+    """Token bucket earning ratio tokens per request, a hedge spends one token"""
+
+    def __init__(self, ratio: float = 0.05, burst: float = 10):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self.stats = {"requests": 0, "hedges": 0, "hedges_won": 0, "denied": 0}
+
+    def on_request(self):
+        self.stats["requests"] += 1
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        if self.tokens < 1:
+            self.stats["denied"] += 1
+            return False
+        self.tokens -= 1
+        self.stats["hedges"] += 1
+        return True
+
+async def hedged(call, delay: float, budget: HedgeBudget):
+    """
+    Run call(), when it has not answered after delay seconds and the budget allows it,
+    run a second call(): the first one to answer wins and the other is cancelled.
+    """
+    budget.on_request()
+    tasks = [asyncio.ensure_future(call())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done and budget.try_acquire():
+            tasks.append(asyncio.ensure_future(call()))
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        winner = tasks[0] if tasks[0] in done else tasks[1]
+        if winner is not tasks[0]:
+            budget.stats["hedges_won"] += 1
+        return winner.result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
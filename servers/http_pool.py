@@ -0,0 +1,184 @@
+import time
+import asyncio
+import aiohttp
+
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+class UpstreamBusyError(Exception):
+    """Raised when a request waits longer than the host max_queue_wait for a slot"""
+
+class HttpPool:
+    """Singleton-like pool of aiohttp sessions, one per upstream host"""
+
+    _sessions = {}
+    _hosts = {}
+    _semaphores = {}
+    _stats = {}
+    _timeout = None
+    _limit = 100
+    _limit_per_host = 50
+    _keepalive_timeout = 30
+
+    @classmethod
+    def initialize(cls,
+                   timeout: aiohttp.ClientTimeout,
+                   limit: int = 100,
+                   limit_per_host: int = 50,
+                   keepalive_timeout: int = 30):
+        cls._timeout = timeout
+        cls._limit = limit
+        cls._limit_per_host = limit_per_host
+        cls._keepalive_timeout = keepalive_timeout
+
+    @classmethod
+    def configure_host(cls,
+                       origin: str,
+                       max_connections: int,
+                       max_concurrency: int,
+                       max_queue_wait: float = None):
+        """
+        Set the connection and concurrency budget of one upstream host, before it is used:
+        its semaphore is replaced, so it is refused while requests hold or wait for a slot.
+        """
+        stats = cls._stats.get(origin)
+        if stats and (stats["in_flight"] or stats["waiting"]):
+            raise RuntimeError(f"{origin} has {stats['in_flight']} requests in flight and {stats['waiting']} waiting, "
+                               "its budget can not be changed")
+        cls._hosts[origin] = {
+            "max_connections": max_connections,
+            "max_concurrency": max_concurrency,
+            "max_queue_wait": max_queue_wait,
+        }
+        cls._semaphores.pop(origin, None)
+
+    @staticmethod
+    def origin(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    @classmethod
+    def _host_config(cls, key: str) -> dict:
+        return cls._hosts.get(key) or {
+            "max_connections": cls._limit_per_host,
+            "max_concurrency": cls._limit_per_host,
+            "max_queue_wait": None,
+        }
+
+    @classmethod
+    def get_session(cls, url: str) -> aiohttp.ClientSession:
+        """Return the shared session for the url host, creating it on first use"""
+        key = cls.origin(url)
+        session = cls._sessions.get(key)
+        if session is None or session.closed:
+            max_connections = cls._host_config(key)["max_connections"]
+            connector = aiohttp.TCPConnector(
+                limit=min(cls._limit, max_connections),
+                limit_per_host=max_connections,
+                keepalive_timeout=cls._keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            session = aiohttp.ClientSession(timeout=cls._timeout, connector=connector)
+            cls._sessions[key] = session
+        return session
+
+    @classmethod
+    def _host_stats(cls, key: str) -> dict:
+        return cls._stats.setdefault(key, {
+            "waiting": 0,
+            "in_flight": 0,
+            "acquired": 0,
+            "rejected": 0,
+            "wait_total_ms": 0.0,
+            "wait_max_ms": 0.0,
+            "timeouts": 0,
+            "errors": 0,
+            "retries": 0,
+        })
+
+    @classmethod
+    def count(cls, url: str, counter: str):
+        """Increment a counter (timeouts, errors, retries) of the url host"""
+        cls._host_stats(cls.origin(url))[counter] += 1
+
+    @classmethod
+    @asynccontextmanager
+    async def slot(cls, url: str, timeout: float = None):
+        """Wait for a concurrency slot of the url host, at most max_queue_wait or timeout, recording the queue wait"""
+        key = cls.origin(url)
+        config = cls._host_config(key)
+        waits = [wait for wait in (config["max_queue_wait"], timeout) if wait is not None]
+        max_wait = min(waits) if waits else None
+
+        semaphore = cls._semaphores.get(key)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(config["max_concurrency"])
+            cls._semaphores[key] = semaphore
+
+        stats = cls._host_stats(key)
+
+        stats["waiting"] += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=max_wait)
+        except asyncio.TimeoutError:
+            stats["rejected"] += 1
+            raise UpstreamBusyError(f"{key} has no free slot after {max_wait}s")
+        finally:
+            stats["waiting"] -= 1
+
+        wait_ms = (time.perf_counter() - start) * 1000
+        stats["acquired"] += 1
+        stats["wait_total_ms"] += wait_ms
+        stats["wait_max_ms"] = max(stats["wait_max_ms"], wait_ms)
+        stats["in_flight"] += 1
+        try:
+            yield
+        finally:
+            stats["in_flight"] -= 1
+            semaphore.release()
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Budget and queue-wait counters per upstream host"""
+        result = {}
+        for key in set(cls._hosts) | set(cls._stats):
+            stats = dict(cls._stats.get(key, {}))
+            if stats.get("acquired"):
+                stats["wait_avg_ms"] = round(stats["wait_total_ms"] / stats["acquired"], 3)
+            result[key] = {**cls._host_config(key), **stats}
+        return result
+
+    @classmethod
+    async def close(cls):
+        sessions, cls._sessions = cls._sessions, {}
+        cls._semaphores = {}
+        for session in sessions.values():
+            await session.close()
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers with the same key"""
+
+    def __init__(self):
+        self.leaders = 0
+        self.shared = 0
+        self._calls = {}
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.shared += 1
+        # shielded so a cancelled caller does not cancel the call of the others
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "shared": self.shared,
+        }
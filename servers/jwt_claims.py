@@ -0,0 +1,78 @@
+import json
+import math
+import time
+import base64
+import hashlib
+
+from cache import LruTtlCache
+
+class JwtError(Exception):
+    """Raised when a jwt is rejected locally, status is the http status code to report"""
+
+    def __init__(self, message: str, status: int = 401):
+        super().__init__(message)
+        self.status = status
+
+class JwtInspector:
+    """
+    Decode jwt claims once and keep them in an LRU keyed by the token hash.
+    The signature is NOT verified here, the upstream services still do it: this only
+    rejects tokens that would fail anyway (malformed, expired, missing scope) before any network I/O.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600, leeway: float = 30):
+        self.leeway = leeway
+        self._claims = LruTtlCache(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def _decode(jwt_token: str) -> dict:
+        try:
+            claims = jwt_token.split(".")[1]
+            claims = json.loads(base64.urlsafe_b64decode(claims + "=" * (-len(claims) % 4)))
+        except Exception:
+            raise JwtError("JWT malformed")
+        if not isinstance(claims, dict):
+            raise JwtError("JWT malformed")
+        # the claims read below must have their registered types, anything else is malformed
+        for name in ("exp", "nbf"):
+            value = claims.get(name)
+            if value is not None and not (isinstance(value, (int, float)) and not isinstance(value, bool)
+                                          and math.isfinite(value)):
+                raise JwtError("JWT malformed")
+        for name in ("scope", "scp"):
+            value = claims.get(name)
+            if value is not None and not (isinstance(value, str)
+                                          or isinstance(value, list) and all(isinstance(scope, str) for scope in value)):
+                raise JwtError("JWT malformed")
+        sub = claims.get("sub")
+        if sub is not None and (isinstance(sub, bool) or not isinstance(sub, (str, int, float))):
+            raise JwtError("JWT malformed")
+        return claims
+
+    def claims(self, jwt_token: str) -> dict:
+        """The decoded claims plus scopes (a set) and tier, raise JwtError when malformed"""
+        key = hashlib.sha256(jwt_token.encode()).hexdigest()
+        claims = self._claims.get(key)
+        if claims is None:
+            claims = self._decode(jwt_token)
+            scopes = claims.get("scope") or claims.get("scp") or []
+            claims["scopes"] = set(scopes.split() if isinstance(scopes, str) else scopes)
+            claims["tier"] = claims.get("tier")
+            self._claims.set(key, claims)
+        return claims
+
+    def check(self, jwt_token: str, required_scopes=()) -> dict:
+        """Return the claims of a token that is not expired and has every required scope"""
+        claims = self.claims(jwt_token)
+        now = time.time()
+        if claims.get("exp") is not None and claims["exp"] < now - self.leeway:
+            raise JwtError("JWT expired")
+        if claims.get("nbf") is not None and claims["nbf"] > now + self.leeway:
+            raise JwtError("JWT not yet valid")
+        missing = set(required_scopes) - claims["scopes"]
+        if missing:
+            raise JwtError(f"JWT missing scopes {sorted(missing)}", status=403)
+        return claims
+
+    def stats(self) -> dict:
+        return self._claims.stats()
@@ -0,0 +1,147 @@
+import sys
+import json
+import queue
+import atexit
+import random
+import reprlib
+import logging
+import logging.handlers
+
+from datetime import datetime, timezone
+
+class CappedFormatter(logging.Formatter):
+    """
+    Build the message from record.msg % args with every argument capped first
+    (reprlib for containers, a slice of str() for anything else), so a whole upstream payload
+    is never rendered only to be truncated. The record itself is not mutated.
+    With json_output a line is one JSON object: ts, level, logger, msg (+ exc).
+    """
+
+    def __init__(self,
+                 fmt=None,
+                 datefmt=None,
+                 style='%',
+                 max_arg_length: int = 200,
+                 max_msg_length: int = 1000,
+                 json_output: bool = False):
+        super().__init__(fmt, datefmt, style)
+        self.max_arg_length = max_arg_length
+        self.max_msg_length = max_msg_length
+        self.json_output = json_output
+        self._repr = reprlib.Repr()
+        self._repr.maxlevel = 3
+        self._repr.maxdict = 10
+        self._repr.maxlist = 10
+        self._repr.maxstring = max_arg_length
+        self._repr.maxother = max_arg_length
+
+    def _cap(self, arg):
+        if isinstance(arg, (int, float, bool)) or arg is None:
+            return arg
+        if isinstance(arg, (dict, list, tuple, set, frozenset)):
+            return self._repr.repr(arg)
+        # exceptions and other objects log their str(), as an uncapped %s would
+        arg = arg if isinstance(arg, str) else str(arg)
+        return arg if len(arg) <= self.max_arg_length else arg[:self.max_arg_length] + "..."
+
+    def message(self, record) -> str:
+        msg = str(record.msg)
+        args = record.args
+        if args:
+            try:
+                # logging unpacks a lone mapping argument into record.args
+                if isinstance(args, dict) and "%(" in msg:
+                    msg = msg % {key: self._cap(value) for key, value in args.items()}
+                elif isinstance(args, dict):
+                    msg = msg % (self._cap(args),)
+                else:
+                    msg = msg % tuple(self._cap(arg) for arg in args)
+            except (TypeError, ValueError):
+                msg = record.getMessage()
+        if len(msg) > self.max_msg_length:
+            msg = msg[:self.max_msg_length] + "..."
+        return msg
+
+    def format(self, record) -> str:
+        message = self.message(record)
+        if not self.json_output:
+            # the parent formatter reads %(message)s from record.message, msg/args stay untouched
+            record.message = message
+            if self.usesTime():
+                record.asctime = self.formatTime(record, self.datefmt)
+            text = self.formatMessage(record)
+            if record.exc_info:
+                text += "\n" + self.formatException(record.exc_info)
+            return text
+
+        line = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": message,
+        }
+        if record.exc_info:
+            line["exc"] = self.formatException(record.exc_info)
+        return json.dumps(line, ensure_ascii=False, default=str)
+
+class DebugSampler(logging.Filter):
+    """Let through only sample_rate of the DEBUG records, other levels always pass"""
+
+    def __init__(self, sample_rate: float = 0.1):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.sample_rate
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Only enqueue the record on the caller (the event loop), formatting and the
+    stream write happen on the listener thread. When the queue is full the record
+    is dropped and counted instead of blocking the caller.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # QueueHandler.prepare formats the message here, leave it to the listener
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def setup_logging(level: str = "INFO",
+                  json_output: bool = False,
+                  max_arg_length: int = 200,
+                  max_msg_length: int = 1000,
+                  debug_sample_rate: float = 0.1,
+                  queue_size: int = 10000) -> NonBlockingQueueHandler:
+    """
+    Route the root logger through a bounded queue drained by a QueueListener thread.
+    Replaces any handler already on the root logger, the listener is stopped at exit.
+    """
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(DebugSampler(debug_sample_rate))
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(CappedFormatter('%(asctime)s - %(levelname)s - %(message)s',
+                                                max_arg_length=max_arg_length,
+                                                max_msg_length=max_msg_length,
+                                                json_output=json_output))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return queue_handler
@@ -2,8 +2,13 @@ import os
 from datetime import datetime
 from mcp.server.fastmcp import FastMCP
 
+from metrics import Metrics, instrument_tools, add_metrics_route
+from serving import serve
+
 PORT = os.getenv("PORT", "9001")
 HOST = os.getenv("HOST", "127.0.0.1")
+WORKERS = int(os.getenv("WORKERS", "1"))
+WORKER_INTERNAL_PORT = int(os.getenv("WORKER_INTERNAL_PORT", "0")) or None
 
 mcp = FastMCP(name="math_server",        
         host=HOST,
@@ -11,6 +16,8 @@ mcp = FastMCP(name="math_server",
         debug=True,
     )
 
+metrics = Metrics("math_server")
+
 ################## MATH ##################################
 @mcp.tool(name="add")
 def add(a: float, b: float) -> float:
@@ -72,9 +79,16 @@ def divide(a: float, b: float) -> float:
     if b == 0:
         raise ValueError("Cannot divide by zero")
     return float(a / b)
-    
+
+################## METRICS ###############################
+instrument_tools(mcp, metrics)
+add_metrics_route(mcp, metrics)
+
+def build_app():
+    return mcp.streamable_http_app()
+
 if __name__ == "__main__":
     print("-" * 45)
-    print(f"MATH SERVER {HOST}:{PORT}")
+    print(f"MATH SERVER {HOST}:{PORT} WORKERS {WORKERS}")
     print("-" * 45)
-    mcp.run(transport="streamable-http")
\ No newline at end of file
+    serve(build_app, HOST, PORT, workers=WORKERS, internal_port=WORKER_INTERNAL_PORT, log_level=mcp.settings.log_level.lower())
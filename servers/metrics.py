@@ -0,0 +1,158 @@
+import time
+import bisect
+import functools
+
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = {key: str(value).replace("\\", "\\\\").replace('"', '\\"') for key, value in labels.items()}
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped.items()) + "}"
+
+class Histogram:
+    """Cumulative buckets, sum and count of the observed values, rendered like a Prometheus histogram"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: dict) -> list:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+        lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {self.count}")
+        lines.append(f"{name}_sum{_labels(labels)} {self.sum}")
+        lines.append(f"{name}_count{_labels(labels)} {self.count}")
+        return lines
+
+class Metrics:
+    """
+    In-process counters, gauges and histograms keyed by name and labels.
+    Everything runs on the event loop thread, so no locking is needed.
+    """
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self._help = {}
+        self._types = {}
+        self._series = {}
+
+    def _series_of(self, kind: str, name: str, help: str) -> dict:
+        name = f"{self.namespace}_{name}"
+        if name not in self._types:
+            self._types[name] = kind
+            self._help[name] = help
+            self._series[name] = {}
+        return self._series[name]
+
+    def inc(self, name: str, help: str = "", value: float = 1, **labels):
+        series = self._series_of("counter", name, help)
+        key = tuple(labels.items())
+        series[key] = series.get(key, 0) + value
+
+    def gauge(self, name: str, help: str = "", delta: float = 0, **labels):
+        series = self._series_of("gauge", name, help)
+        key = tuple(labels.items())
+        series[key] = series.get(key, 0) + delta
+
+    def observe(self, name: str, value: float, help: str = "", buckets=LATENCY_BUCKETS, **labels):
+        series = self._series_of("histogram", name, help)
+        key = tuple(labels.items())
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = Histogram(buckets)
+            series[key] = histogram
+        histogram.observe(value)
+
+    def render(self) -> str:
+        """Prometheus text exposition format 0.0.4"""
+        lines = []
+        for name, series in self._series.items():
+            lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {self._types[name]}")
+            for key, value in series.items():
+                if isinstance(value, Histogram):
+                    lines.extend(value.render(name, dict(key)))
+                else:
+                    lines.append(f"{name}{_labels(dict(key))} {value}")
+        return "\n".join(lines) + "\n"
+
+def result_size(result) -> int:
+    if isinstance(result, (str, bytes)):
+        return len(result)
+    return len(str(result))
+
+def instrument_tools(mcp, metrics: Metrics, is_error=None):
+    """
+    Wrap every tool registered on mcp to record its calls, errors, in-flight calls,
+    latency and response size. A tool raising counts as an error, so does a result
+    for which is_error(result) is true (tools returning their error as a message).
+    Call it once all the tools are registered.
+    """
+
+    def record(tool: str, start: float, result=None, failed: bool = False):
+        metrics.observe("tool_duration_seconds", time.perf_counter() - start,
+                        "Tool call latency", tool=tool)
+        metrics.gauge("tool_in_flight", "Tool calls in progress", -1, tool=tool)
+        if failed or (is_error is not None and is_error(result)):
+            metrics.inc("tool_errors_total", "Tool calls that raised or returned an error", tool=tool)
+        if not failed:
+            metrics.observe("tool_response_bytes", result_size(result),
+                            "Tool response size", buckets=SIZE_BUCKETS, tool=tool)
+
+    def wrap(tool):
+        fn = tool.fn
+        name = tool.name
+
+        def begin():
+            metrics.inc("tool_calls_total", "Tool calls", tool=name)
+            metrics.gauge("tool_in_flight", "Tool calls in progress", 1, tool=name)
+            return time.perf_counter()
+
+        if tool.is_async:
+            @functools.wraps(fn)
+            async def instrumented(*args, **kwargs):
+                start = begin()
+                try:
+                    result = await fn(*args, **kwargs)
+                except BaseException:
+                    record(name, start, failed=True)
+                    raise
+                record(name, start, result)
+                return result
+        else:
+            @functools.wraps(fn)
+            def instrumented(*args, **kwargs):
+                start = begin()
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException:
+                    record(name, start, failed=True)
+                    raise
+                record(name, start, result)
+                return result
+        tool.fn = instrumented
+
+    for tool in mcp._tool_manager.list_tools():
+        wrap(tool)
+
+def add_metrics_route(mcp, metrics: Metrics, path: str = "/metrics"):
+    """Expose metrics in Prometheus text format next to the mcp endpoint"""
+
+    @mcp.custom_route(path, methods=["GET"])
+    async def metrics_route(request: Request) -> PlainTextResponse:
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
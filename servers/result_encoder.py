@@ -0,0 +1,55 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# batch results: {"results": {id: record}, "errors": {id: error}}
+WRAPPERS = ("results", "errors")
+
+def project(data, fields: list):
+    """
+    Keep only the given fields of every record in data.
+
+    Lists are projected per item and the batch wrappers per id, the errors of a batch
+    are kept whole so a failure is never projected away. A record without any of the
+    fields keeps the projection of its nested records (e.g. the moviments of a statement),
+    and becomes {} when none of them has the fields either.
+    """
+    if isinstance(data, list):
+        return [project(item, fields) for item in data]
+    if not isinstance(data, dict):
+        return data
+    projected = {key: value for key, value in data.items() if key in fields and key not in WRAPPERS}
+    if isinstance(data.get("results"), dict):
+        projected["results"] = {key: project(value, fields) for key, value in data["results"].items()}
+    elif "results" in data:
+        projected["results"] = project(data["results"], fields)
+    if "errors" in data:
+        projected["errors"] = data["errors"]
+    if projected:
+        return projected
+    return _project_nested(data, fields)
+
+def _project_nested(record: dict, fields) -> dict:
+    """The non empty projections of the dict and list-of-dict values of a record"""
+    nested = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            value = project(value, fields)
+            if value:
+                nested[key] = value
+        elif isinstance(value, list) and any(isinstance(item, dict) for item in value):
+            value = [project(item, fields) for item in value if isinstance(item, dict)]
+            if any(value):
+                nested[key] = value
+    return nested
+
+def encode_result(data, fields: list = None) -> str:
+    """Compact JSON of a tool result, projected on fields when given"""
+    if fields:
+        data = project(data, set(fields))
+    if orjson is not None:
+        return orjson.dumps(data, default=str).decode()
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str)
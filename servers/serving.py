@@ -0,0 +1,236 @@
+import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+import logging
+import multiprocessing
+
+import httpx
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+SESSION_HEADER = b"mcp-session-id"
+RESTART_WINDOW = 30
+MAX_RESTART_DELAY = 30
+HOP_BY_HOP = {b"connection", b"keep-alive", b"transfer-encoding", b"upgrade", b"host"}
+
+class SessionAffinity:
+    """
+    ASGI middleware keeping a streamable-http session on the worker that created it.
+
+    The session ids handed out by worker i are prefixed with "w<i>-", a request carrying
+    another worker's session id is streamed to that worker on its loopback port, read from
+    internal_ports (shared with the other workers, 0 until the worker has bound it).
+    With keep-alive most requests of a session already reach its worker, only the others
+    (e.g. the GET event stream opened on a new connection) take the extra hop.
+    """
+
+    def __init__(self, app, worker: int, internal_ports):
+        self.app = app
+        self.worker = worker
+        self.internal_ports = internal_ports
+        self.prefix = f"w{worker}-".encode()
+        self._client = None
+
+    def owner(self, session_id: bytes):
+        """(worker index, local session id) of a tagged session id, None when it is not tagged"""
+        tag, separator, local_id = session_id.partition(b"-")
+        if not separator or not tag.startswith(b"w") or not tag[1:].isdigit():
+            return None
+        worker = int(tag[1:])
+        if worker >= len(self.internal_ports):
+            return None
+        return worker, local_id
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        session_id = next((value for key, value in scope["headers"] if key == SESSION_HEADER), None)
+        owner = self.owner(session_id) if session_id else None
+        if owner is not None:
+            worker, local_id = owner
+            if worker != self.worker:
+                return await self.proxy(worker, scope, receive, send)
+            scope = {**scope, "headers": [(key, local_id if key == SESSION_HEADER else value)
+                                          for key, value in scope["headers"]]}
+
+        async def tagged_send(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [(key, self.prefix + value if key.lower() == SESSION_HEADER else value)
+                                                   for key, value in message.get("headers", [])]}
+            await send(message)
+
+        await self.app(scope, receive, tagged_send)
+
+    async def proxy(self, worker: int, scope, receive, send):
+        body = b""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(None, connect=5))
+        url = f"http://127.0.0.1:{self.internal_ports[worker]}{scope['path']}"
+        if scope.get("query_string"):
+            url += "?" + scope["query_string"].decode("latin-1")
+        headers = [(key, value) for key, value in scope["headers"] if key not in HOP_BY_HOP and key != b"content-length"]
+
+        try:
+            if not self.internal_ports[worker]:
+                raise httpx.ConnectError("not listening yet")
+            request = self._client.build_request(scope["method"], url, headers=headers, content=body)
+            response = await self._client.send(request, stream=True)
+        except httpx.HTTPError as e:
+            # the owner is gone with its sessions, 404 makes the client start a new session
+            logger.warning("session worker %s unreachable: %s", worker, e)
+            await send({"type": "http.response.start", "status": 404, "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body",
+                        "body": b'{"jsonrpc":"2.0","id":null,"error":{"code":-32001,"message":"Session not found"}}'})
+            return
+
+        async def stream():
+            await send({"type": "http.response.start", "status": response.status_code,
+                        "headers": [(key, value) for key, value in response.headers.raw if key.lower() not in HOP_BY_HOP]})
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def disconnected():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        tasks = [asyncio.ensure_future(stream()), asyncio.ensure_future(disconnected())]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            if tasks[0] in done:
+                tasks[0].result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await response.aclose()
+
+def bind(host: str, port: int, reuse_port: bool = False) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(build_app, host: str, port: int, worker: int, internal_port: int, internal_ports,
+               session_affinity: bool, log_level: str):
+    """
+    One worker process: the app (behind SessionAffinity) on the shared port and on 127.0.0.1:internal_port,
+    a port picked by the OS when internal_port is 0. The bound port is published in internal_ports[worker].
+    """
+    app = build_app()
+    if session_affinity:
+        app = SessionAffinity(app, worker, internal_ports)
+    internal = bind("127.0.0.1", internal_port)
+    internal_ports[worker] = internal.getsockname()[1]
+    logger.info("worker %s internal port %s", worker, internal_ports[worker])
+    sockets = [bind(host, port, reuse_port=True), internal]
+    server = uvicorn.Server(uvicorn.Config(app, log_level=log_level))
+    server.run(sockets=sockets)
+
+def serve(build_app,
+          host: str,
+          port: int,
+          workers: int = 1,
+          internal_port: int = None,
+          session_affinity: bool = True,
+          log_level: str = "info",
+          max_restarts: int = 5):
+    """
+    Run the app returned by build_app() with uvicorn, in workers processes sharing port through
+    SO_REUSEPORT. Worker i also listens on 127.0.0.1, used to route the requests of its sessions
+    and to scrape its own /metrics: on internal_port + i when internal_port is set, otherwise on a
+    port picked by the OS (logged at start), so two servers on one host never collide.
+    A stateless app (no mcp-session-id) can turn session_affinity off.
+
+    Workers are spawned, so each one imports the server module again (own event loop, pools,
+    log and span threads), WORKER_INDEX is set in their environment. A worker that exits is restarted,
+    the sessions it held are lost and their clients get a 404 asking them to start a new session.
+    A worker exiting within RESTART_WINDOW seconds of its start is restarted after a doubling delay,
+    after max_restarts such exits in a row the server gives up and exits with status 1.
+    """
+    port = int(port)
+    if workers > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        logger.warning("SO_REUSEPORT is not available, serving with one worker")
+        workers = 1
+    if workers <= 1:
+        uvicorn.run(build_app(), host=host, port=port, log_level=log_level)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    # bound port of each worker, written by the worker and read by the SessionAffinity of the others
+    internal_ports = context.RawArray("i", workers)
+    processes = {}
+    started_at = {}
+    failures = {worker: 0 for worker in range(workers)}
+    restart_at = {}
+
+    def start(worker: int):
+        os.environ["WORKER_INDEX"] = str(worker)
+        # a restarted worker may get another port, its old one must not be dialed meanwhile
+        internal_ports[worker] = 0
+        process = context.Process(target=run_worker, name=f"worker-{worker}",
+                                  args=(build_app, host, port, worker, internal_port + worker if internal_port else 0,
+                                        internal_ports, session_affinity, log_level))
+        process.start()
+        processes[worker] = process
+        started_at[worker] = time.monotonic()
+        logger.info("worker %s pid %s on %s:%s", worker, process.pid, host, port)
+
+    stopping = False
+    exit_code = 0
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for worker in range(workers):
+        start(worker)
+    while not stopping:
+        time.sleep(1)
+        now = time.monotonic()
+        for worker, process in list(processes.items()):
+            if stopping:
+                break
+            if worker in restart_at:
+                if now >= restart_at[worker]:
+                    del restart_at[worker]
+                    start(worker)
+                continue
+            if process.is_alive():
+                continue
+            # a worker dying right after its start (e.g. its port can not be bound) would do it again
+            failures[worker] = failures[worker] + 1 if now - started_at[worker] < RESTART_WINDOW else 0
+            if failures[worker] > max_restarts:
+                logger.error("worker %s exited with %s %s times in a row, giving up",
+                             worker, process.exitcode, failures[worker])
+                stopping = True
+                exit_code = 1
+                break
+            delay = min(2 ** failures[worker], MAX_RESTART_DELAY) if failures[worker] else 0
+            logger.warning("worker %s exited with %s, restarting it in %ss", worker, process.exitcode, delay)
+            restart_at[worker] = now + delay
+
+    for process in processes.values():
+        process.terminate()
+    for process in processes.values():
+        process.join(timeout=30)
+    sys.exit(exit_code)
@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import hashlib
+import asyncio
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+class DurableSpool:
+    """
+    Append-only SQLite (WAL) spool of pending writes, replayed by a background drainer.
+
+    submit() only appends a row, so the caller never waits on the target
+    service. The drainer flushes up to max_batch due rows per key in at most
+    concurrency parallel batches, flush(key, items) returns the http status
+    code of the write:
+        - 200 deletes the rows.
+        - a permanent failure (4xx but 408 and 429) moves them to the dead_letter table.
+        - anything else (or flush raising) retries them after a backoff doubling per
+          attempt, up to max_backoff, while the other rows keep flowing. After
+          max_attempts they are moved to the dead_letter table too.
+    Rows left at shutdown are replayed on the next start.
+    """
+
+    def __init__(self,
+                 path: str,
+                 flush,
+                 max_batch: int = 50,
+                 max_delay: float = 0.5,
+                 max_pending: int = 100000,
+                 concurrency: int = 4,
+                 max_backoff: float = 30,
+                 max_attempts: int = 20):
+        self.path = path
+        self.flush = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.concurrency = concurrency
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.stats = {"queued": 0, "batches": 0, "flushed": 0, "failed": 0, "dead_lettered": 0, "last_flush_at": None}
+        self._pending = 0
+        self._db = None
+        self._drainer = None
+        self._wakeup = None
+        self._closing = False
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS spool (
+                                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                    key TEXT NOT NULL,
+                                    payload TEXT NOT NULL,
+                                    created_at REAL NOT NULL,
+                                    attempts INTEGER NOT NULL DEFAULT 0,
+                                    next_attempt_at REAL NOT NULL DEFAULT 0)""")
+            columns = [column[1] for column in self._db.execute("PRAGMA table_info(spool)")]
+            if "next_attempt_at" not in columns:
+                # spool written before the per-row backoff
+                self._db.execute("ALTER TABLE spool ADD COLUMN next_attempt_at REAL NOT NULL DEFAULT 0")
+            self._db.execute("CREATE INDEX IF NOT EXISTS spool_due ON spool (next_attempt_at, id)")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS dead_letter (
+                                    id INTEGER PRIMARY KEY,
+                                    key TEXT NOT NULL,
+                                    payload TEXT NOT NULL,
+                                    created_at REAL NOT NULL,
+                                    attempts INTEGER NOT NULL,
+                                    status INTEGER,
+                                    failed_at REAL NOT NULL)""")
+            self._pending = self._db.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+        return self._db
+
+    def start(self):
+        """Start the drainer, replaying what a previous run left in the spool"""
+        self._connect()
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._drainer is None or self._drainer.done():
+            self._closing = False
+            self._drainer = asyncio.create_task(self._drain())
+
+    def pending(self) -> int:
+        self._connect()
+        return self._pending
+
+    async def submit(self, key: str, item: dict):
+        """Append item to the spool, waits only while max_pending rows are already spooled"""
+        self.start()
+        while self.pending() >= self.max_pending:
+            await asyncio.sleep(self.max_delay)
+        self._db.execute("INSERT INTO spool (key, payload, created_at) VALUES (?, ?, ?)",
+                         (key, json.dumps(item), time.time()))
+        self._pending += 1
+        self.stats["queued"] += 1
+        self._wakeup.set()
+
+    async def _drain(self):
+        while True:
+            if not await self.drain_once():
+                if self._closing:
+                    return
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._next_due())
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+            else:
+                # let more rows accumulate into the next batch
+                await asyncio.sleep(0 if self._closing else self.max_delay)
+
+    def _next_due(self):
+        """Seconds until the next row waiting on its backoff is due, None when the spool is empty"""
+        next_attempt_at = self._db.execute("SELECT MIN(next_attempt_at) FROM spool").fetchone()[0]
+        if next_attempt_at is None:
+            return None
+        return min(max(next_attempt_at - time.time(), 0), self.max_backoff)
+
+    @staticmethod
+    def is_permanent(status) -> bool:
+        """A rejected write that would be rejected again on replay"""
+        return status is not None and 400 <= status < 500 and status not in (408, 429)
+
+    def _dead_letter(self, ids: list, status):
+        self._db.execute("BEGIN")
+        self._db.executemany("""INSERT INTO dead_letter (id, key, payload, created_at, attempts, status, failed_at)
+                                SELECT id, key, payload, created_at, attempts + 1, ?, ? FROM spool WHERE id = ?""",
+                             [(status, time.time(), row_id) for (row_id,) in ids])
+        self._db.executemany("DELETE FROM spool WHERE id = ?", ids)
+        self._db.execute("COMMIT")
+
+    async def drain_once(self) -> bool:
+        """Flush one round of the due batches, returns True when there was any"""
+        rows = self._db.execute("""SELECT id, key, payload, attempts FROM spool
+                                   WHERE next_attempt_at <= ? ORDER BY id LIMIT ?""",
+                                (time.time(), self.max_batch * self.concurrency)).fetchall()
+        if not rows:
+            return False
+
+        batches = {}
+        for row_id, key, payload, attempts in rows:
+            key_batches = batches.setdefault(key, [[]])
+            if len(key_batches[-1]) == self.max_batch:
+                key_batches.append([])
+            key_batches[-1].append((row_id, json.loads(payload), attempts))
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def flush_batch(key, batch):
+            async with semaphore:
+                try:
+                    status = await self.flush(key, [item for _, item, _ in batch])
+                except Exception as e:
+                    logger.error("spool flush of %s items failed: %s", len(batch), e)
+                    status = None
+            self.stats["batches"] += 1
+            if status == 200:
+                self._db.executemany("DELETE FROM spool WHERE id = ?", [(row_id,) for row_id, _, _ in batch])
+                self._pending -= len(batch)
+                self.stats["flushed"] += len(batch)
+                self.stats["last_flush_at"] = time.time()
+                return
+
+            permanent = self.is_permanent(status)
+            dead = [(row_id,) for row_id, _, attempts in batch if permanent or attempts + 1 >= self.max_attempts]
+            retried = [(time.time() + min(self.max_delay * 2 ** (attempts + 1), self.max_backoff), row_id)
+                       for row_id, _, attempts in batch if not permanent and attempts + 1 < self.max_attempts]
+            if dead:
+                # the key may be a credential (the Authorization header of the graph spool), only its hash is logged
+                logger.error("spool dead-lettered %s items of key %.12s, statuscode: %s",
+                             len(dead), hashlib.sha256(key.encode()).hexdigest(), status)
+                self._dead_letter(dead, status)
+                self._pending -= len(dead)
+                self.stats["dead_lettered"] += len(dead)
+            if retried:
+                self._db.executemany("UPDATE spool SET attempts = attempts + 1, next_attempt_at = ? WHERE id = ?",
+                                     retried)
+                self.stats["failed"] += len(retried)
+
+        await asyncio.gather(*(flush_batch(key, batch)
+                               for key, key_batches in batches.items()
+                               for batch in key_batches))
+        return True
+
+    def lag(self) -> dict:
+        """Pending rows, age of the oldest one, retry counters and dead letters, to watch the drainer"""
+        db = self._connect()
+        oldest, max_attempts = db.execute("SELECT MIN(created_at), MAX(attempts) FROM spool").fetchone()
+        return {
+            **self.stats,
+            "pending": self._pending,
+            "oldest_pending_age_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "max_attempts": max_attempts or 0,
+            "dead_letter": db.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0],
+        }
+
+    async def close(self, timeout: float = 10):
+        """Try to drain the spool before shutdown, what is left stays on disk"""
+        if self._drainer is not None and not self._drainer.done():
+            self._closing = True
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(self._drainer, timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning("spool closed with %s pending items", self.pending())
+        if self._db is not None:
+            self._db.close()
+            self._db = None
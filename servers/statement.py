@@ -0,0 +1,112 @@
+from collections import defaultdict
+
+# field names tried in order on each ledger moviment
+TYPE_FIELDS = ("type", "moviment_type", "transaction_type")
+AMOUNT_FIELDS = ("amount", "value")
+DATE_FIELDS = ("transaction_at", "created_at", "charged_at", "date")
+
+# moviment types that increase the balance, any other type decreases it
+CREDIT_TYPES = {"DEPOSIT", "CREDIT", "REFUND"}
+
+def _field(moviment: dict, names: tuple):
+    for name in names:
+        if moviment.get(name) is not None:
+            return moviment[name]
+    return None
+
+def find_moviments(statement) -> list:
+    """Return the list of moviments of a movimentStatement payload, wherever it is nested"""
+    if isinstance(statement, list):
+        if all(isinstance(item, dict) for item in statement):
+            return statement
+        return []
+    if isinstance(statement, dict):
+        for value in statement.values():
+            moviments = find_moviments(value)
+            if moviments and _field(moviments[0], AMOUNT_FIELDS) is not None:
+                return moviments
+    return []
+
+def find_closing_balance(statement):
+    """The amount of the account_balance of a movimentStatement payload, None when it has none"""
+    if not isinstance(statement, dict):
+        return None
+    balance = statement.get("account_balance")
+    if isinstance(balance, dict):
+        try:
+            return float(_field(balance, AMOUNT_FIELDS))
+        except (TypeError, ValueError):
+            return None
+    return None
+
+def summarize_moviments(moviments: list,
+                        date_from: str = None,
+                        date_to: str = None,
+                        top: int = 5,
+                        closing_balance: float = None) -> dict:
+    """
+    Aggregate moviments into totals, counts per type, daily balances and the top moviments.
+
+    Dates are compared on their YYYY-MM-DD prefix, date_from and date_to are inclusive.
+    With closing_balance (the account balance after every moviment of the statement) each day
+    has the balance at its end, walking back from the closing balance. Without it the balance
+    is unknown and each day has the cumulative_net of the selected moviments instead.
+    """
+    selected = []
+    net_after = defaultdict(float)
+    for moviment in moviments:
+        date = str(_field(moviment, DATE_FIELDS) or "")[:10]
+        try:
+            amount = float(_field(moviment, AMOUNT_FIELDS) or 0)
+        except (TypeError, ValueError):
+            amount = 0.0
+        kind = str(_field(moviment, TYPE_FIELDS) or "UNKNOWN").upper()
+        signed = amount if kind in CREDIT_TYPES else -amount
+        net_after[date] += signed
+        if date_from and date < date_from:
+            continue
+        if date_to and date > date_to:
+            continue
+        selected.append((date, kind, amount, signed, moviment))
+
+    per_type = defaultdict(lambda: {"count": 0, "total": 0.0})
+    per_day = defaultdict(float)
+    for date, kind, amount, signed, _ in selected:
+        per_type[kind]["count"] += 1
+        per_type[kind]["total"] = round(per_type[kind]["total"] + amount, 2)
+        per_day[date] += signed
+
+    daily_balances = []
+    balance = 0.0
+    for date in sorted(per_day):
+        balance += per_day[date]
+        daily_balances.append({"date": date,
+                               "net": round(per_day[date], 2),
+                               "cumulative_net": round(balance, 2)})
+
+    if closing_balance is not None:
+        # balance at the end of a day: the closing balance minus every later moviment
+        later = 0.0
+        dates = sorted(net_after, reverse=True)
+        end_of_day = {}
+        for date in dates:
+            end_of_day[date] = closing_balance - later
+            later += net_after[date]
+        for day in daily_balances:
+            del day["cumulative_net"]
+            day["balance"] = round(end_of_day[day["date"]], 2)
+
+    top_moviments = sorted(selected, key=lambda item: item[2], reverse=True)[:top]
+
+    return {
+        "period": {"from": date_from or (daily_balances[0]["date"] if daily_balances else None),
+                   "to": date_to or (daily_balances[-1]["date"] if daily_balances else None)},
+        "count": len(selected),
+        "credits": round(sum(item[3] for item in selected if item[3] > 0), 2),
+        "debits": round(-sum(item[3] for item in selected if item[3] < 0), 2),
+        "net": round(balance, 2),
+        "closing_balance": closing_balance,
+        "per_type": dict(per_type),
+        "daily_balances": daily_balances,
+        "top_moviments": [item[4] for item in top_moviments],
+    }
@@ -0,0 +1,267 @@
+import os
+import json
+import time
+import queue
+import atexit
+import inspect
+import logging
+import threading
+import functools
+import contextvars
+import urllib.request
+
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT = "traceparent"
+
+# OTLP span kinds
+INTERNAL = 1
+SERVER = 2
+CLIENT = 3
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+def parse_traceparent(traceparent: str):
+    """(trace_id, parent span_id) of a W3C traceparent header, None when it is missing or malformed"""
+    if not traceparent:
+        return None
+    parts = traceparent.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2]
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+class Span:
+    """One timed operation of a trace, encoded as an OTLP/JSON span once ended"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, kind: int = INTERNAL, attributes: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_error(self, message: str):
+        self.error = message
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(key, value) for key, value in self.attributes.items() if value is not None],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+class SpanExporter:
+    """
+    Batch ended spans on a background thread and write them as OTLP/JSON
+    ExportTraceServiceRequest documents: one per line to path, and/or POSTed
+    to an OTLP/HTTP collector endpoint (e.g. http://localhost:4318/v1/traces).
+    A full queue drops spans instead of blocking the caller.
+    """
+
+    def __init__(self,
+                 service: str,
+                 path: str = None,
+                 endpoint: str = None,
+                 max_batch: int = 256,
+                 max_delay: float = 1.0,
+                 max_queue: int = 10000):
+        self.service = service
+        self.path = path
+        self.endpoint = endpoint
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def export(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            spans = []
+            try:
+                span = self._queue.get(timeout=self.max_delay)
+                if span is None:
+                    return
+                spans.append(span)
+                while len(spans) < self.max_batch:
+                    span = self._queue.get_nowait()
+                    if span is None:
+                        self._write(spans)
+                        return
+                    spans.append(span)
+            except queue.Empty:
+                pass
+            if spans:
+                self._write(spans)
+
+    def _write(self, spans: list):
+        document = {"resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", self.service)]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": [span.to_otlp() for span in spans]}],
+        }]}
+        body = json.dumps(document, separators=(",", ":"))
+        try:
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.write(body + "\n")
+            if self.endpoint:
+                request = urllib.request.Request(self.endpoint, data=body.encode(), method="POST",
+                                                 headers={"Content-Type": "application/json"})
+                urllib.request.urlopen(request, timeout=5).close()
+        except Exception as e:
+            logger.warning("span export of %s spans failed: %s", len(spans), e)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+class Tracer:
+    """
+    Create spans parented to the current one (a contextvar, so asyncio tasks inherit it)
+    or to a remote W3C traceparent. Without an exporter the trace context is still
+    propagated but no span is recorded.
+    """
+
+    def __init__(self, service: str, exporter: SpanExporter = None):
+        self.service = service
+        self.exporter = exporter
+
+    @contextmanager
+    def span(self, name: str, kind: int = INTERNAL, traceparent: str = None, **attributes):
+        parent = _current_span.get()
+        remote = parse_traceparent(traceparent) if parent is None else None
+        if parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        elif remote is not None:
+            trace_id, parent_id = remote
+        else:
+            trace_id, parent_id = os.urandom(16).hex(), None
+
+        span = Span(name, trace_id, parent_id, kind, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            if self.exporter is not None:
+                self.exporter.export(span)
+
+    def traced(self, name: str = None, kind: int = INTERNAL):
+        """Decorator running a sync or async function inside a span"""
+
+        def decorator(fn):
+            span_name = name or fn.__name__
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def wrapper(*args, **kwargs):
+                    with self.span(span_name, kind):
+                        return await fn(*args, **kwargs)
+            else:
+                @functools.wraps(fn)
+                def wrapper(*args, **kwargs):
+                    with self.span(span_name, kind):
+                        return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+def current_span():
+    return _current_span.get()
+
+def current_traceparent() -> str:
+    """traceparent of the current span, to send along with an outgoing call, None outside a trace"""
+    span = _current_span.get()
+    return span.traceparent if span is not None else None
+
+def tracer_from_env(service: str) -> Tracer:
+    """Tracer exporting to TRACE_FILE and/or TRACE_OTLP_ENDPOINT, when neither is set spans are not recorded"""
+    path = os.getenv("TRACE_FILE")
+    endpoint = os.getenv("TRACE_OTLP_ENDPOINT")
+    exporter = SpanExporter(service, path=path, endpoint=endpoint) if path or endpoint else None
+    return Tracer(service, exporter)
+
+def request_traceparent(mcp) -> str:
+    """traceparent of the MCP request being handled: params._meta first, then the http header"""
+    try:
+        request_context = mcp.get_context().request_context
+    except (ValueError, LookupError):
+        return None
+    meta = request_context.meta
+    traceparent = getattr(meta, TRACEPARENT, None) if meta is not None else None
+    if traceparent is None and meta is not None and meta.model_extra:
+        traceparent = meta.model_extra.get(TRACEPARENT)
+    if traceparent is None and request_context.request is not None:
+        traceparent = request_context.request.headers.get(TRACEPARENT)
+    return traceparent
+
+def trace_tools(mcp, tracer: Tracer):
+    """
+    Run every tool registered on mcp inside a SERVER span continuing the trace of
+    the MCP request. Call it once all the tools are registered.
+    """
+
+    def wrap(tool):
+        fn = tool.fn
+        name = tool.name
+
+        if tool.is_async:
+            @functools.wraps(fn)
+            async def traced_tool(*args, **kwargs):
+                with tracer.span(f"tool {name}", SERVER, request_traceparent(mcp), **{"mcp.tool": name}):
+                    return await fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def traced_tool(*args, **kwargs):
+                with tracer.span(f"tool {name}", SERVER, request_traceparent(mcp), **{"mcp.tool": name}):
+                    return fn(*args, **kwargs)
+        tool.fn = traced_tool
+
+    for tool in mcp._tool_manager.list_tools():
+        wrap(tool)